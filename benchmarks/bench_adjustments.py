@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import history
+from coco_quant.eod.adjustments import adjustment_factors, adjust_prices
+
+
+def per_symbol(prices: pd.DataFrame, splits: pd.DataFrame, dividends: pd.DataFrame) -> pd.DataFrame:
+    # the adjustment as done symbol by symbol and event by event
+    frames = []
+    for symbol, bars in prices.groupby("symbol", sort=False):
+        bars = bars.copy()
+        raw = bars["close"].copy()
+        for event in splits.loc[splits["symbol"] == symbol].itertuples():
+            before = bars["date"] < event.date
+            bars.loc[before, "close"] /= event.ratio
+            bars.loc[before, "volume"] *= event.ratio
+        for event in dividends.loc[dividends["symbol"] == symbol].itertuples():
+            before = bars["date"] < event.date
+            if before.any():
+                bars.loc[before, "close"] *= 1 - event.unadjustedvalue / raw.loc[before].iloc[-1]
+        frames.append(bars)
+    return pd.concat(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="split and dividend adjustment of an exchange: the vectorized factors "
+                                                 "against a per-symbol loop over the bars")
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=2500)
+    args = parser.parse_args()
+
+    bars = {f"S{i:05d}.US": history(f"S{i:05d}.US", args.rows) for i in range(args.symbols)}
+    prices = pd.DataFrame([(symbol, pd.Timestamp(day), close, volume) for symbol, rows in bars.items()
+                           for day, close, volume, _, _ in rows], columns=["symbol", "date", "close", "volume"])
+    splits = pd.DataFrame([(symbol, pd.Timestamp(day), split) for symbol, rows in bars.items()
+                           for day, _, _, split, _ in rows if split != 1.0], columns=["symbol", "date", "ratio"])
+    dividends = pd.DataFrame([(symbol, pd.Timestamp(day), dividend) for symbol, rows in bars.items()
+                              for day, _, _, _, dividend in rows if dividend > 0],
+                             columns=["symbol", "date", "unadjustedvalue"])
+
+    prices["volume"] = prices["volume"].astype(float)
+    start = time.perf_counter()
+    expected = per_symbol(prices, splits, dividends)
+    looped = time.perf_counter() - start
+
+    start = time.perf_counter()
+    factors = adjustment_factors(prices, splits, dividends)
+    computed = time.perf_counter() - start
+    start = time.perf_counter()
+    adjusted = adjust_prices(prices, factors)
+    applied = time.perf_counter() - start
+
+    error = (adjusted["close"] / expected["close"] - 1).abs().max()
+    print(f"{len(prices)} bars, {len(factors)} events of {args.symbols} symbols")
+    print(f"per-symbol loop: {looped:.3f}s, factors: {computed:.3f}s, adjustment: {applied:.3f}s, "
+          f"max relative difference: {error:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import MockEodServer
+from coco_quant.eod import EodDataDownloader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="eod_prices_exchange throughput against a local mock server")
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=250)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests-per-second", type=float, default=None)
+    args = parser.parse_args()
+
+    with MockEodServer(args.symbols, args.rows, args.latency) as server:
+        print(f"{'workers':>8} {'seconds':>10} {'symbols/sec':>12}")
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as base_dir:
+                eod = EodDataDownloader(base_dir, "demo", max_workers=workers,
+                                        requests_per_second=args.requests_per_second, base_url=server.url)
+                start = time.perf_counter()
+                eod.eod_prices_exchange("US")
+                elapsed = time.perf_counter() - start
+                print(f"{workers:>8} {elapsed:>10.2f} {args.symbols / elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import fundamentals, news
+from coco_quant.eod.eod_prices import parse_json
+from coco_quant.eod.sentiments import SentimentsData
+from coco_quant.eod.schema import apply_schema, EARNINGS_SCHEMA, FINANCIALS_SCHEMA
+
+
+def legacy_parse_json(data: dict, key: str, sub_key: str) -> pd.DataFrame:
+    # the row-by-row concatenation replaced by the single-pass parse_json
+    df = None
+    for item in data[key][sub_key].values():
+        tmp = pd.DataFrame.from_dict([item])
+        df = pd.concat([df, tmp], ignore_index=True) if df is not None else tmp
+    df.columns = df.columns.str.lower()
+    return df
+
+
+def legacy_parse_sentiments(data: pd.DataFrame) -> pd.DataFrame:
+    sentiment = None
+    for i in range(len(data.sentiment)):
+        tmp = pd.DataFrame.from_dict([data.sentiment.iloc[i]])
+        sentiment = pd.concat([sentiment, tmp], ignore_index=True) if sentiment is not None else tmp
+    data = data.drop('sentiment', axis=1)
+    data['date'] = pd.to_datetime(data['date'])
+    return pd.concat([data, sentiment], axis=1)
+
+
+def rows_per_second(fn, repeat: int) -> float:
+    rows, start = 0, time.perf_counter()
+    for _ in range(repeat):
+        rows += len(fn())
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rows/sec of the fundamentals and news parsers")
+    parser.add_argument("--fundamentals", help="recorded fundamentals/{symbol} response, synthetic if omitted")
+    parser.add_argument("--news", help="recorded news response, synthetic if omitted")
+    parser.add_argument("--periods", type=int, default=160)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--legacy", action="store_true", help="also time the row-by-row implementation")
+    args = parser.parse_args()
+
+    data = json.load(open(args.fundamentals)) if args.fundamentals else fundamentals("AAPL.US", args.periods)
+    items = json.load(open(args.news)) if args.news else news("AAPL.US", args.items)
+
+    cases = {
+        "earnings_history": lambda: apply_schema(parse_json(data, "Earnings", "History"), EARNINGS_SCHEMA),
+        "financials_balance_sheet_quarterly":
+            lambda: apply_schema(parse_json(data["Financials"], "Balance_Sheet", "quarterly"), FINANCIALS_SCHEMA),
+        "sentiments": lambda: SentimentsData.parse_sentiments(pd.DataFrame.from_dict(items)),
+    }
+    if args.legacy:
+        cases["earnings_history (legacy)"] = lambda: legacy_parse_json(data, "Earnings", "History")
+        cases["financials_balance_sheet_quarterly (legacy)"] = lambda: legacy_parse_json(data["Financials"], "Balance_Sheet", "quarterly")
+        cases["sentiments (legacy)"] = lambda: legacy_parse_sentiments(pd.DataFrame.from_dict(items))
+
+    print(f"{'table':<45} {'rows/sec':>12}")
+    for name, fn in cases.items():
+        print(f"{name:<45} {rows_per_second(fn, args.repeat):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
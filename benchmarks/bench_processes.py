@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import MockEodServer
+from coco_quant.eod import EodDataDownloader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stock_fundamentals_exchange throughput by number of worker processes")
+    parser.add_argument("--symbols", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--workers", type=int, default=4, help="threads per process")
+    parser.add_argument("--requests-per-second", type=float, default=None)
+    args = parser.parse_args()
+
+    with MockEodServer(args.symbols, latency=args.latency) as server:
+        print(f"{'processes':>9} {'seconds':>10} {'symbols/sec':>12} {'failed':>7}")
+        for processes in args.processes:
+            with tempfile.TemporaryDirectory() as base_dir:
+                eod = EodDataDownloader(base_dir, "demo", max_workers=args.workers, processes=processes,
+                                        requests_per_second=args.requests_per_second, base_url=server.url)
+                start = time.perf_counter()
+                summary = eod.stock_fundamentals_exchange("US")
+                elapsed = time.perf_counter() - start
+                print(f"{processes:>9} {elapsed:>10.2f} {summary['symbols'] / elapsed:>12.1f} {summary['failed']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import eod_prices_csv, fundamentals
+from coco_quant.eod.eod_prices import EodPricesData, parse_csv, KeyValue
+from coco_quant.eod.fundamentals import StockFundamentalsData
+from coco_quant.eod.schema import EOD_PRICES_SCHEMA
+from coco_quant.eod.reader import EodDataReader
+
+DATASETS = ["eod_prices", "fundamentals/stock/financials_balance_sheet_quarterly", "fundamentals/stock/earnings_history"]
+
+
+def size(dataset_dir: str) -> int:
+    return sum(os.path.getsize(path) for path in glob.glob(f"{dataset_dir}/*.parq"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="file size, write and load time of the storage profiles")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=2500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    symbols = [f"S{i:05d}.US" for i in range(args.symbols)]
+    prices = {symbol: parse_csv(eod_prices_csv(symbol, args.rows), KeyValue("symbol", symbol), EOD_PRICES_SCHEMA)
+              for symbol in symbols}
+    parser = StockFundamentalsData("", "")
+    tables = {symbol: parser.extract_tables(symbol, fundamentals(symbol)) for symbol in symbols}
+
+    print(f"{'profile':>10} {'dataset':>36} {'MB':>8} {'write s':>8} {'load s':>8}")
+    for profile in [None, "fast-read", "archive"]:
+        with tempfile.TemporaryDirectory() as base_dir:
+            feeds = [EodPricesData(base_dir, "", profile=profile), StockFundamentalsData(base_dir, "", profile=profile)]
+            start = time.perf_counter()
+            for symbol in symbols:
+                feeds[0].to_parquet(symbol, prices[symbol], "eod_prices")
+                for name in ["financials_balance_sheet_quarterly", "earnings_history"]:
+                    feeds[1].to_parquet(symbol, tables[symbol][name], name)
+            written = time.perf_counter() - start
+            reader = EodDataReader(base_dir)
+            for dataset in DATASETS:
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    reader.read(dataset)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                print(f"{profile or 'default':>10} {dataset:>36} {size(f'{base_dir}/{dataset}') / 2 ** 20:>8.2f} "
+                      f"{written:>8.2f} {best:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
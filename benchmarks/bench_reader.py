@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import time
+import tempfile
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import eod_prices_csv
+from coco_quant.eod.eod_prices import parse_csv, KeyValue
+from coco_quant.eod.schema import EOD_PRICES_SCHEMA
+from coco_quant.eod.storage import ParquetFileStorage
+from coco_quant.eod.reader import EodDataReader
+
+
+def naive_panel(base_dir: str, start: str, end: str) -> pd.DataFrame:
+    # the per-file loop the reader replaces
+    frames = [pd.read_parquet(path) for path in glob.glob(f"{base_dir}/eod_prices/*.parq")]
+    data = pd.concat(frames, ignore_index=True)
+    data = data.loc[(data["date"] >= start) & (data["date"] <= end)]
+    return data.pivot(index="date", columns="symbol", values="close").sort_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="close-price panel load time, EodDataReader vs a pd.read_parquet loop")
+    parser.add_argument("--symbols", type=int, default=3000)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--start", default="2010-01-01")
+    parser.add_argument("--end", default="2012-12-31")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        storage = ParquetFileStorage()
+        for i in range(args.symbols):
+            symbol = f"S{i:05d}.US"
+            data = parse_csv(eod_prices_csv(symbol, args.rows), KeyValue("symbol", symbol), EOD_PRICES_SCHEMA)
+            storage.write(f"{base_dir}/eod_prices", symbol, data)
+        reader = EodDataReader(base_dir, storage, max_workers=args.workers)
+        print(f"{'method':>8} {'seconds':>10} {'shape':>14}")
+        for name, fn in [("naive", lambda: naive_panel(base_dir, args.start, args.end)),
+                         ("reader", lambda: reader.panel("close", start=args.start, end=args.end))]:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                panel = fn()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:>8} {best:>10.3f} {str(panel.shape):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# runs in a fresh interpreter: the time of every startup stage of a job that downloads prices, in ms
+CHILD = """
+import sys, json, time, tempfile
+stages = {}
+start = time.perf_counter()
+import coco_quant.eod
+stages["import coco_quant.eod"] = time.perf_counter() - start
+start = time.perf_counter()
+from coco_quant.eod import EodDataDownloader
+stages["import EodDataDownloader"] = time.perf_counter() - start
+pandas = "pandas" in sys.modules
+with tempfile.TemporaryDirectory() as base_dir:
+    start = time.perf_counter()
+    eod = EodDataDownloader(base_dir, "demo")
+    stages["construct"] = time.perf_counter() - start
+    pandas = pandas or "pandas" in sys.modules
+    start = time.perf_counter()
+    eod.feed("eod_prices")
+    stages["first feed (eod_prices)"] = time.perf_counter() - start
+print(json.dumps(dict({name: seconds * 1000 for name, seconds in stages.items()}, pandas=pandas)))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import and construction time of EodDataDownloader in a fresh process")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]))
+    runs, walls = [], []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", CHILD], env=env, check=True, capture_output=True, text=True).stdout
+        walls.append((time.perf_counter() - start) * 1000)
+        runs.append(json.loads(output))
+    print(f"{'stage':>28} {'median ms':>10} {'min ms':>8}")
+    for name in [name for name in runs[0] if name != "pandas"]:
+        values = [run[name] for run in runs]
+        print(f"{name:>28} {statistics.median(values):>10.1f} {min(values):>8.1f}")
+    print(f"{'process':>28} {statistics.median(walls):>10.1f} {min(walls):>8.1f}")
+    print(f"pandas loaded before the first feed: {any(run['pandas'] for run in runs)}")
+
+
+if __name__ == "__main__":
+    main()
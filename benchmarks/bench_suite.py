@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import tempfile
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import MockEodServer
+from coco_quant.eod import EodDataDownloader, EodDataReader
+
+COUNTRIES = ["USA", "GBR", "DEU", "FRA", "JPN", "CHN", "IND", "BRA"]
+
+# name: (setup, run, check), run returns the number of symbols, indicator pairs or windows it processed and
+# check(eod, args, items) asserts what was stored
+ENTRY_POINTS = {
+    "eod_prices_exchange": (None, lambda eod, args: eod.eod_prices_exchange("US")["symbols"],
+                            lambda eod, args, items: check_prices(eod, args, items, args.rows)),
+    "eod_prices_exchange_incremental": (lambda eod, args: drop_last_bars(eod, args.new_rows),
+                                        lambda eod, args: eod.eod_prices_exchange("US", incremental=True)["symbols"],
+                                        lambda eod, args, items: check_prices(eod, args, items, args.rows)),
+    "eod_prices_exchange_last_day": (lambda eod, args: drop_last_bars(eod, 1),
+                                     lambda eod, args: eod.eod_prices_exchange_last_day("US") or args.symbols,
+                                     lambda eod, args, items: check_prices(eod, args, items, args.rows)),
+    "stock_fundamentals_exchange": (None, lambda eod, args: eod.stock_fundamentals_exchange("US")["symbols"], None),
+    "stock_fundamentals_exchange_bulk": (None, lambda eod, args: eod.stock_fundamentals_exchange("US", bulk=True)["symbols"],
+                                         None),
+    "etf_fundamentals_exchange": (None, lambda eod, args: eod.etf_fundamentals_exchange("US")["symbols"], None),
+    "mutual_fund_fundamentals_exchange": (None, lambda eod, args: eod.mutual_fund_fundamentals_exchange("US")["symbols"],
+                                          None),
+    "sentiments_exchange": (None, lambda eod, args: eod.sentiments_exchange("US")["symbols"], None),
+    "financial_news_exchange": (None, lambda eod, args: eod.financial_news_exchange("US")["symbols"], None),
+    "financial_news_exchange_incremental": (None, lambda eod, args: eod.financial_news_exchange("US", incremental=True)["symbols"],
+                                            None),
+    "corporate_actions_exchange": (lambda eod, args: eod.eod_prices_exchange("US"),
+                                   lambda eod, args: eod.corporate_actions_exchange("US")["symbols"], None),
+    "corporate_actions_last_day": (lambda eod, args: eod.corporate_actions_exchange("US"),
+                                   lambda eod, args: len(eod.corporate_actions_last_day("US", DIVIDEND_DAY)), None),
+    "macro_indicators_countries": (None, lambda eod, args: macro_indicators_countries(eod, COUNTRIES[:args.countries]),
+                                   None),
+    "macro_indicators": (None, lambda eod, args: macro_indicators(eod, COUNTRIES[:args.countries]), None),
+    "economic_events": (None, lambda eod, args: eod.economic_events("2022-01-01", "2022-12-31") or 53, None),
+}
+
+# the calls of EodDataDownloader for one symbol, made one after the other for the first single_symbols symbols
+SINGLE_CALLS = ["eod_prices", "stock_fundamentals", "etf_fundamentals", "mutual_fund_fundamentals", "index_fundamentals",
+                "sentiments", "financial_news", "corporate_actions"]
+
+# the ex-date of the first quarterly dividends of the mock's symbols
+DIVIDEND_DAY = "2000-03-03"
+
+# the exchange sweeps of the entry points whose items are the symbols of the exchange
+SWEEPS = [name for name in ENTRY_POINTS if name.endswith(("_exchange", "_exchange_bulk", "_exchange_incremental"))]
+
+
+def single_calls(method: str):
+    def run(eod: EodDataDownloader, args) -> int:
+        symbols = [f"S{i:05d}.US" for i in range(min(args.single_symbols, args.symbols))]
+        for symbol in symbols:
+            getattr(eod, method)(symbol)
+        return len(symbols)
+
+    return run
+
+
+ENTRY_POINTS.update({name: (None, single_calls(name), None) for name in SINGLE_CALLS})
+
+
+def drop_last_bars(eod: EodDataDownloader, bars: int) -> None:
+    # the stored histories without their last bars, for the incremental and last-day updates to append
+    eod.eod_prices_exchange("US")
+    feed = eod.feed("eod_prices")
+    for symbol in EodDataReader(feed.base_dir, catalog=eod.catalog).symbols():
+        data = feed.storage.read(f"{feed.base_dir}/eod_prices", symbol)
+        feed.to_parquet(symbol, data.iloc[:-bars], "eod_prices")
+
+
+def check_prices(eod: EodDataDownloader, args, items: int, rows: int) -> None:
+    data = EodDataReader(eod.feed("eod_prices").base_dir, catalog=eod.catalog).read("eod_prices", columns=["symbol"])
+    symbols = data["symbol"].nunique() if data is not None else 0
+    assert symbols == args.symbols, f"{symbols} of {args.symbols} symbols stored"
+    assert len(data) == args.symbols * rows, f"{len(data)} bars stored instead of {args.symbols * rows}"
+
+
+def macro_indicators_countries(eod: EodDataDownloader, countries: list) -> int:
+    eod.macro_indicators_countries(countries)
+    return len(countries) * len(eod.feed("macro_indicators").get_methods())
+
+
+def macro_indicators(eod: EodDataDownloader, countries: list) -> int:
+    # the indicators of every country one by one, into a directory per indicator
+    for country in countries:
+        eod.macro_indicators(country)
+    return len(countries) * len(eod.feed("macro_indicators").get_methods())
+
+
+def peak_rss() -> int:
+    # bytes, the peak since the last reset_peak_rss() where /proc allows resetting it
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def reset_peak_rss() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def run_entry(name: str, url: str, args) -> dict:
+    # runs in a fresh process, so that the peak RSS is the one of this entry point
+    setup, run, check = ENTRY_POINTS[name]
+    logging.getLogger("coco_quant").setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as base_dir:
+        eod = EodDataDownloader(base_dir, "demo", max_workers=args.workers, base_url=url, max_retries=args.max_retries,
+                                backoff=0.01)
+        try:
+            if setup is not None:
+                setup(eod, args)
+            eod.metrics.reset()
+            reset_peak_rss()
+            start = time.perf_counter()
+            items = run(eod, args)
+            seconds = time.perf_counter() - start
+            snapshot = eod.metrics.snapshot()
+            # the counts are exact on the synthetic payloads only, without injected errors or recorded fixtures
+            if args.error_rate == 0 and args.fixtures is None:
+                assert name not in SWEEPS or items == args.symbols, f"{items} of {args.symbols} symbols swept"
+                if check is not None:
+                    check(eod, args, items)
+        except Exception as ex:
+            # e.g. an injected error on a call made without retries, the exception may not pickle
+            return dict(entry=name, error=f"{type(ex).__name__}: {ex}")
+    received = sum(entry["bytes"] for entry in snapshot["stages"] if entry["stage"] == "request")
+    failed = sum(count for entry in snapshot["stages"] if entry["stage"] == "request"
+                 for status, count in entry["statuses"].items() if status not in ("ok", "cached"))
+    return dict(entry=name, seconds=seconds, items=items, items_per_second=items / seconds, mb=received / 2 ** 20,
+                mb_per_second=received / 2 ** 20 / seconds, peak_rss_mb=peak_rss() / 2 ** 20, failed_requests=failed,
+                retries=sum(snapshot["retries"].values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="throughput and peak memory of the exchange sweeps, daily updates and "
+                                                 "single-symbol calls of EodDataDownloader against a local mock of the API")
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=2500)
+    parser.add_argument("--new-rows", type=int, default=5, help="bars appended by the incremental price sweep")
+    parser.add_argument("--periods", type=int, default=40)
+    parser.add_argument("--countries", type=int, default=4)
+    parser.add_argument("--single-symbols", type=int, default=20, help="symbols of the single-symbol calls")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--fixtures", default=None, help="directory of responses recorded with RecordingTransport")
+    parser.add_argument("--entries", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with MockEodServer(args.symbols, args.rows, args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                       periods=args.periods, fixtures_dir=args.fixtures) as server:
+        print(f"{'entry point':>36} {'seconds':>8} {'items':>6} {'items/s':>8} {'MB':>8} {'MB/s':>7} {'RSS MB':>7} {'retries':>7}")
+        for name in args.entries:
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(run_entry, name, server.url, args).result()
+            results.append(result)
+            if "error" in result:
+                print(f"{name:>36} failed: {result['error']}")
+                continue
+            print(f"{name:>36} {result['seconds']:>8.2f} {result['items']:>6} {result['items_per_second']:>8.1f} "
+                  f"{result['mb']:>8.1f} {result['mb_per_second']:>7.1f} {result['peak_rss_mb']:>7.0f} {result['retries']:>7}")
+        print(f"server: {server.server.requests} requests, {server.server.errors} errors, "
+              f"{server.server.bytes_sent / 2 ** 20:.1f} MB sent")
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import os
+import ssl
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_server import MockEodServer
+from coco_quant.eod.transport import UrllibTransport, PooledTransport
+
+
+def measure(transport, url: str, requests: int) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        transport.get(f"{url}/fundamentals/S{i:05d}.US?api_token=demo")
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-request latency of urlopen vs the pooled keep-alive transport")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--certfile", help="serve over TLS with this certificate (e.g. a self-signed one)")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    context = None
+    if args.certfile is not None:
+        context = ssl.create_default_context(cafile=args.certfile)
+        context.check_hostname = False
+
+    with MockEodServer(latency=args.latency, certfile=args.certfile, keyfile=args.keyfile) as server:
+        urllib_ms = measure(UrllibTransport(context=context), server.url, args.requests) * 1000
+        pooled = PooledTransport(context=context)
+        pooled_ms = measure(pooled, server.url, args.requests) * 1000
+        pooled.close()
+        print(f"{'transport':>10} {'ms/request':>12}")
+        print(f"{'urlopen':>10} {urllib_ms:>12.3f}")
+        print(f"{'pooled':>10} {pooled_ms:>12.3f}")
+        print(f"connection setup saved per request: {urllib_ms - pooled_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
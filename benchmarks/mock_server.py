@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+import os
+import ssl
+import gzip
+import json
+import time
+import random
+import sys
+import threading
+from functools import lru_cache
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from coco_quant.eod.transport import fixture_name
+
+
+# the CSV responses of the API end with a line that is not a row, the parsers drop it
+CSV_TRAILER = "# end of data"
+
+
+@lru_cache(maxsize=1024)
+def history(symbol: str, rows: int) -> list:
+    # (day, close, volume, split, dividend) of rows days from 2000-01-03, the close is unadjusted: it drops by the
+    # split ratio and by the dividend on the ex-dates of the symbol's corporate actions
+    rnd, actions = random.Random(symbol), random.Random(f"actions:{symbol}")
+    splits = {day: actions.choice([2.0, 3.0, 0.5]) for day in actions.sample(range(1, rows), min(2, rows - 1))} \
+        if rows > 1 and actions.random() < 0.5 else {}
+    quarterly = actions.random() < 0.7
+    bars, day, price = [], date(2000, 1, 3), 100.0
+    for i in range(rows):
+        price = max(price * (1 + rnd.gauss(0, 0.01)), 0.01)
+        volume = rnd.randint(1000, 10 ** 7)
+        split = splits.get(i, 1.0)
+        price /= split
+        dividend = round(price * 0.005, 4) if quarterly and i % 91 == 60 else 0.0
+        price = max(price - dividend, 0.01)
+        bars.append((day, price, volume, split, dividend))
+        day += timedelta(days=1)
+    return bars
+
+
+def adjusted_closes(bars: list) -> list:
+    # the closes adjusted for the later splits and dividends, from the last day backwards
+    adjusted, factor = [0.0] * len(bars), 1.0
+    for i in range(len(bars) - 1, -1, -1):
+        adjusted[i] = bars[i][1] * factor
+        _, _, _, split, dividend = bars[i]
+        if i > 0 and (split != 1.0 or dividend > 0):
+            factor *= (1 - dividend * split / bars[i - 1][1]) / split
+    return adjusted
+
+
+def eod_prices_csv(symbol: str, rows: int, from_: str = None) -> str:
+    # the days before from_ are left out
+    bars = history(symbol, rows)
+    lines = ["Date,Open,High,Low,Close,Adjusted_close,Volume"]
+    for (day, price, volume, _, _), adjusted in zip(bars, adjusted_closes(bars)):
+        if from_ is None or day.isoformat() >= from_:
+            lines.append(f"{day},{price:.4f},{price * 1.01:.4f},{price * 0.99:.4f},{price:.4f},{adjusted:.4f},{volume}")
+    return "\n".join(lines + [CSV_TRAILER]) + "\n"
+
+
+def splits(symbol: str, rows: int, day: str = None) -> list:
+    split = lambda ratio: f"{ratio:.6f}/1.000000" if ratio >= 1 else f"1.000000/{1 / ratio:.6f}"
+    return [{"date": str(bar[0]), "split": split(bar[3])} for bar in history(symbol, rows)
+            if bar[3] != 1.0 and (day is None or str(bar[0]) == day)]
+
+
+def dividends(symbol: str, rows: int, day: str = None) -> list:
+    # value is adjusted for the later splits as the API's
+    bars = history(symbol, rows)
+    later = 1.0
+    items = []
+    for bar in reversed(bars):
+        if bar[4] > 0 and (day is None or str(bar[0]) == day):
+            items.append({"date": str(bar[0]), "declarationDate": None, "recordDate": str(bar[0]),
+                          "paymentDate": str(bar[0]), "period": "Quarterly", "value": round(bar[4] / later, 6),
+                          "unadjustedValue": bar[4], "currency": "USD"})
+        later *= bar[3]
+    return list(reversed(items))
+
+
+def bulk_corporate_actions(exchange: str, symbols: int, rows: int, type_: str, day: str = None) -> list:
+    # the splits or dividends of every symbol with the ex-date day, the last day of the histories by default
+    day = day or str(date(2000, 1, 3) + timedelta(days=rows - 1))
+    items = []
+    for i in range(symbols):
+        code = f"S{i:05d}"
+        if type_ == "splits":
+            items.extend({"code": code, "exchange": exchange, **item} for item in splits(f"{code}.{exchange}", rows, day))
+        else:
+            items.extend({"code": code, "exchange": exchange, "dividend": item["value"], **item}
+                         for item in dividends(f"{code}.{exchange}", rows, day))
+    return items
+
+
+def eod_bulk_last_day_csv(exchange: str, symbols: int, rows: int) -> str:
+    # the bars of the last day of the histories
+    day = date(2000, 1, 3) + timedelta(days=rows - 1)
+    lines = ["Code,Ex,Date,Open,High,Low,Close,Adjusted_close,Volume"]
+    for i in range(symbols):
+        lines.append(f"S{i:05d},{exchange},{day},10.0,11.0,9.0,10.5,10.5,1000")
+    return "\n".join(lines + [CSV_TRAILER]) + "\n"
+
+
+def quarter_ends(periods: int) -> list:
+    return [f"{2022 - i // 4}-{12 - 3 * (i % 4):02d}-{30 if i % 4 in (1, 2) else 31}" for i in range(periods)]
+
+
+def financial_statement(periods: int, items: int, rnd: random.Random) -> dict:
+    return {day: dict({"date": day, "filing_date": day, "currency_symbol": "USD"},
+                      **{f"item{j:02d}": f"{rnd.uniform(-1e9, 1e9):.2f}" for j in range(items)})
+            for day in quarter_ends(periods)}
+
+
+def fundamentals(symbol: str, periods: int = 40) -> dict:
+    rnd = random.Random(symbol)
+    days = quarter_ends(periods)
+    statements = {name: {"currency_symbol": "USD", "quarterly": financial_statement(periods, 30, rnd),
+                         "yearly": financial_statement(periods // 4, 30, rnd)}
+                  for name in ["Balance_Sheet", "Cash_Flow", "Income_Statement"]}
+    return {
+        "General": {"Code": symbol.split(".")[0], "Exchange": symbol.split(".")[-1], "CurrencyCode": "USD", "Name": symbol},
+        "Highlights": {"MarketCapitalization": 1.0e9, "EBITDA": 1.0e8, "PERatio": 15.0},
+        "Valuation": {"TrailingPE": 15.0, "ForwardPE": 14.0},
+        "SharesStats": {"SharesOutstanding": 1.0e7, "SharesFloat": 9.0e6},
+        "Technicals": {"Beta": 1.1, "52WeekHigh": 12.0, "52WeekLow": 8.0},
+        "AnalystRatings": {"Rating": 4.0, "TargetPrice": 11.0},
+        "Earnings": {
+            "History": {day: {"reportDate": day, "date": day, "beforeAfterMarket": "AfterMarket", "currency": "USD",
+                              "epsActual": rnd.uniform(0, 2), "epsEstimate": rnd.uniform(0, 2),
+                              "epsDifference": rnd.uniform(-1, 1), "surprisePercent": rnd.uniform(-10, 10)}
+                        for day in days},
+            "Trend": {day: {"date": day, "period": "0q", "growth": "0.1", "earningsEstimateAvg": "1.0"} for day in days[:4]},
+            "Annual": {day: {"date": day, "epsActual": rnd.uniform(0, 8)} for day in days[::4]},
+        },
+        "Financials": statements,
+        "outstandingShares": {
+            "annual": {str(i): {"date": str(2022 - i), "dateFormatted": f"{2022 - i}-12-31", "shares": 1.0e7} for i in range(periods // 4)},
+            "quarterly": {str(i): {"date": day, "dateFormatted": day, "shares": 1.0e7} for i, day in enumerate(days)},
+        },
+    }
+
+
+@lru_cache(maxsize=4096)
+def fundamentals_json(symbol: str, periods: int = 40) -> str:
+    return json.dumps(fundamentals(symbol, periods))
+
+
+def bulk_fundamentals_json(exchange: str, symbols: int, offset: int, limit: int, periods: int, coverage: float) -> str:
+    # a page of the exchange's symbols keyed by position, a share 1 - coverage of the symbols is left out
+    listed = [f"S{i:05d}.{exchange}" for i in range(symbols) if random.Random(i).random() < coverage]
+    return "{" + ", ".join(f'"{i}": {fundamentals_json(symbol, periods)}'
+                           for i, symbol in enumerate(listed[offset:offset + limit])) + "}"
+
+
+def news(symbol: str, items: int, from_: str = None) -> list:
+    # one item an hour, every fourth one is a market article mentioning every symbol
+    start = datetime(2022, 6, 1, tzinfo=timezone.utc)
+    items = [(i, start + timedelta(hours=i)) for i in range(items)]
+    return [{
+        "date": at.isoformat(), "title": f"market news {i}" if i % 4 == 0 else f"{symbol} news {i}", "content": "content",
+        "link": f"https://example.com/market/{i}" if i % 4 == 0 else f"https://example.com/{symbol}/{i}",
+        "symbols": [symbol], "tags": [], "sentiment": {"polarity": 0.5, "neg": 0.1, "neu": 0.7, "pos": 0.2},
+    } for i, at in reversed(items) if from_ is None or at.date().isoformat() >= from_]
+
+
+def news_json(symbol: str, items: int, from_: str = None) -> str:
+    return json.dumps(news(symbol, items, from_))
+
+
+def economic_events(from_: str, to_: str, per_day: int, limit: int) -> list:
+    # per_day events a day, at most limit events newest first, as the API cuts its result
+    first, last = date.fromisoformat(from_), date.fromisoformat(to_)
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    events = [{"type": f"Indicator {i % 7}", "comparison": None, "period": None, "country": ["US", "EU", "JP", "GB"][i % 4],
+               "date": f"{day.isoformat()} {i % 24:02d}:00:00", "actual": float(i), "previous": float(i - 1),
+               "estimate": None, "change": 1.0, "change_percentage": 1.0} for day in days for i in range(per_day)]
+    return list(reversed(events))[:limit]
+
+
+def macro_indicator_json(country: str, indicator: str, years: int) -> str:
+    rnd = random.Random(f"{country}:{indicator}")
+    return json.dumps([{"CountryCode": country, "CountryName": country, "Indicator": indicator,
+                        "Date": f"{2021 - i}-12-31", "Period": "Annual", "Value": rnd.uniform(0, 100)} for i in range(years)])
+
+
+class MockEodHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        time.sleep(server.latency + (server.random(0, server.jitter) if server.jitter > 0 else 0.0))
+        if len(parts) < 2 or parts[0] != "api":
+            return self.reply(404, "not found")
+        if server.error_rate > 0 and server.random(0, 1) < server.error_rate:
+            code = server.error_codes[int(server.random(0, len(server.error_codes))) % len(server.error_codes)]
+            return self.reply(code, "injected error", {"Retry-After": "0"} if code == 429 else {})
+        if server.fixtures_dir is not None:
+            path = f"{server.fixtures_dir}/{fixture_name(self.path)}"
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return self.reply(200, f.read())
+        endpoint, arg = parts[1], "/".join(parts[2:])
+        if endpoint == "eod-bulk-last-day" and params.get("type") in ("splits", "dividends"):
+            return self.reply(200, json.dumps(bulk_corporate_actions(arg, server.symbols, server.rows, params["type"],
+                                                                     params.get("date"))))
+        if endpoint == "eod-bulk-last-day":
+            return self.reply(200, eod_bulk_last_day_csv(arg, server.symbols, server.rows))
+        if endpoint == "eod":
+            return self.reply(200, eod_prices_csv(arg, server.rows, params.get("from")))
+        if endpoint == "splits":
+            return self.reply(200, json.dumps(splits(arg, server.rows)))
+        if endpoint == "div":
+            return self.reply(200, json.dumps(dividends(arg, server.rows)))
+        if endpoint == "fundamentals":
+            return self.reply(200, fundamentals_json(arg, server.periods))
+        if endpoint == "bulk-fundamentals":
+            return self.reply(200, bulk_fundamentals_json(arg, server.symbols, int(params.get("offset", 0)),
+                                                          int(params.get("limit", 500)), server.periods, server.bulk_coverage))
+        if endpoint == "macro-indicator":
+            return self.reply(200, macro_indicator_json(arg, params.get("indicator", ""), server.rows))
+        if endpoint == "economic-events":
+            events = economic_events(params["from"], params["to"], server.events_per_day, int(params.get("limit", 50)))
+            return self.reply(200, json.dumps(events))
+        if endpoint == "news":
+            return self.reply(200, news_json(params.get("s", arg), server.rows, params.get("from")))
+        return self.reply(404, "not found")
+
+    def reply(self, code: int, body, headers: dict = {}) -> None:
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(code)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, 1)
+            self.send_header("Content-Encoding", "gzip")
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(code, len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, seed: int = 0):
+        super().__init__(address, MockEodHandler)
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.requests, self.errors, self.bytes_sent = 0, 0, 0
+
+    def random(self, low: float, high: float) -> float:
+        with self.__lock:
+            return self.__random.uniform(low, high)
+
+    def count(self, code: int, size: int) -> None:
+        with self.__lock:
+            self.requests += 1
+            self.errors += code >= 400
+            self.bytes_sent += size
+
+
+class MockEodServer:
+    # local stand-in for the EOD API: synthetic payloads, or the responses recorded with
+    # coco_quant.eod.transport.RecordingTransport in fixtures_dir where a request has one.
+    # rows sets the price, news and macro history lengths, periods the quarters of fundamentals and
+    # events_per_day the economic events; error_rate of the requests fail with one of error_codes.
+    # bulk-fundamentals lists a share bulk_coverage of the symbols.
+    def __init__(self, symbols: int = 100, rows: int = 250, latency: float = 0.05, port: int = 0,
+                 certfile: str = None, keyfile: str = None, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_codes: tuple = (429, 500, 503), periods: int = 40, events_per_day: int = 40,
+                 fixtures_dir: str = None, seed: int = 0, bulk_coverage: float = 1.0):
+        self.server = MockServer(("127.0.0.1", port), seed)
+        self.scheme = "http"
+        if certfile is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+            self.scheme = "https"
+        self.server.symbols = symbols
+        self.server.rows = rows
+        self.server.latency = latency
+        self.server.jitter = jitter
+        self.server.error_rate = error_rate
+        self.server.error_codes = tuple(error_codes)
+        self.server.periods = periods
+        self.server.events_per_day = events_per_day
+        self.server.fixtures_dir = fixtures_dir
+        self.server.bulk_coverage = bulk_coverage
+        self.__thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{self.scheme}://{host}:{port}/api"
+
+    def __enter__(self):
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1 +1,22 @@
-from .eod import EodDataDownloader
\ No newline at end of file
+import importlib
+import importlib.util
+
+# the classes and submodules are imported on first access, so that importing the package does not load pandas
+__all__ = ["EodDataDownloader", "EodDataReader", "EodDataClient"]
+
+MODULES = {"EodDataDownloader": ".eod", "EodDataReader": ".reader", "EodDataClient": ".client"}
+
+
+def __getattr__(name: str):
+    if name in MODULES:
+        value = getattr(importlib.import_module(MODULES[name], __name__), name)
+    elif not name.startswith("__") and importlib.util.find_spec(f"{__name__}.{name}") is not None:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(MODULES))
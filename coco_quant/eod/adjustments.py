@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+FACTOR_COLUMNS = ["symbol", "date", "split", "dividend", "close", "price_factor", "volume_factor"]
+
+
+def split_ratio(split: pd.Series) -> pd.Series:
+    # the new shares per old share of "4.000000/1.000000"
+    parts = split.astype(str).str.split("/", n=1, expand=True)
+    new = pd.to_numeric(parts[0], errors="coerce")
+    old = pd.to_numeric(parts[1], errors="coerce") if parts.shape[1] > 1 else 1.0
+    return new / old
+
+
+def day_keys(codes: np.ndarray, dates: pd.Series) -> np.ndarray:
+    # one int64 per symbol code and day, ordered by symbol then day
+    days = dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+    return codes.astype(np.int64) * 2 ** 32 + (days + 2 ** 31)
+
+
+def adjustment_factors(prices: pd.DataFrame, splits: pd.DataFrame, dividends: pd.DataFrame) -> pd.DataFrame:
+    # the cumulative factors of many symbols by ex-date. prices has the symbol, date and unadjusted close of the bars,
+    # splits the symbol, date and ratio, dividends the symbol, date and unadjustedvalue. A bar before an ex-date,
+    # and on or after the symbol's previous one, is adjusted by multiplying its prices by price_factor and its
+    # volume by volume_factor.
+    events = []
+    if splits is not None and len(splits) > 0:
+        events.append(pd.DataFrame({"symbol": splits["symbol"], "date": splits["date"], "split": splits["ratio"],
+                                    "dividend": 0.0}))
+    if dividends is not None and len(dividends) > 0:
+        events.append(pd.DataFrame({"symbol": dividends["symbol"], "date": dividends["date"], "split": 1.0,
+                                    "dividend": dividends["unadjustedvalue"]}))
+    if len(events) == 0:
+        return pd.DataFrame(columns=FACTOR_COLUMNS)
+    events = pd.concat(events, ignore_index=True).dropna(subset=["date"])
+    events = events.loc[(events["split"] > 0) & (events["dividend"] >= 0)]
+    # the actions of a symbol on the same day are one event, sorted by symbol and date
+    events = events.groupby(["symbol", "date"], as_index=False, sort=True).agg(split=("split", "prod"),
+                                                                              dividend=("dividend", "sum"))
+    symbols = pd.Index(events["symbol"].unique())
+    codes = symbols.get_indexer(events["symbol"])
+    split, dividend = events["split"].to_numpy(np.float64), events["dividend"].to_numpy(np.float64)
+
+    # the last close before every ex-date, by a binary search of the event keys in the sorted bar keys
+    close = np.full(len(events), np.nan)
+    if prices is not None:
+        prices = prices.dropna(subset=["date", "close"])
+        bar_codes = symbols.get_indexer(prices["symbol"])
+        prices, bar_codes = prices.loc[bar_codes >= 0], bar_codes[bar_codes >= 0]
+    if prices is not None and len(prices) > 0:
+        bar_keys = day_keys(bar_codes, prices["date"])
+        order = np.argsort(bar_keys, kind="stable")
+        bar_keys, bar_codes, closes = bar_keys[order], bar_codes[order], prices["close"].to_numpy(np.float64)[order]
+        keys = day_keys(codes, events["date"])
+        previous = np.maximum(np.searchsorted(bar_keys, keys, side="left") - 1, 0)
+        close = np.where((bar_codes[previous] == codes) & (bar_keys[previous] < keys), closes[previous], np.nan)
+
+    # a dividend paid on the day of a split is per new share, the close before it per old share
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dividend_factor = 1 - dividend * split / close
+    valid = np.isfinite(dividend_factor) & (dividend_factor > 0)
+    skipped = (dividend > 0) & ~valid
+    if skipped.any():
+        logger.warning(f"{skipped.sum()} dividends without a close before the ex-date are not adjusted")
+    dividend_factor = np.where(valid, dividend_factor, 1.0)
+
+    # the factors multiply from the latest event of a symbol backwards
+    reverse = slice(None, None, -1)
+    price = pd.Series((dividend_factor / split)[reverse]).groupby(codes[reverse]).cumprod().to_numpy()[reverse]
+    volume = pd.Series(split[reverse]).groupby(codes[reverse]).cumprod().to_numpy()[reverse]
+    return pd.DataFrame({"symbol": events["symbol"], "date": events["date"], "split": split, "dividend": dividend,
+                         "close": close, "price_factor": price, "volume_factor": volume})
+
+
+def adjust_prices(prices: pd.DataFrame, factors: pd.DataFrame) -> pd.DataFrame:
+    # the bars of many symbols adjusted for their later splits and dividends: every bar takes the factors
+    # of the first ex-date of its symbol after its day, found by a binary search over the sorted factor keys
+    if factors is None or len(factors) == 0:
+        price, volume = np.ones(len(prices)), np.ones(len(prices))
+    else:
+        symbols = pd.Index(factors["symbol"].unique())
+        codes = symbols.get_indexer(factors["symbol"])
+        keys = day_keys(codes, factors["date"])
+        order = np.argsort(keys, kind="stable")
+        keys, codes = keys[order], codes[order]
+        price_factors = factors["price_factor"].to_numpy(np.float64)[order]
+        volume_factors = factors["volume_factor"].to_numpy(np.float64)[order]
+        bar_codes = symbols.get_indexer(prices["symbol"])
+        following = np.searchsorted(keys, day_keys(bar_codes, prices["date"]), side="right")
+        clipped = np.minimum(following, len(keys) - 1)
+        found = (following < len(keys)) & (codes[clipped] == bar_codes) & (bar_codes >= 0)
+        found &= prices["date"].notna().to_numpy()
+        price = np.where(found, price_factors[clipped], 1.0)
+        volume = np.where(found, volume_factors[clipped], 1.0)
+    adjusted = {column: prices[column].to_numpy(np.float64, na_value=np.nan) * price
+                for column in PRICE_COLUMNS if column in prices.columns}
+    if "volume" in prices.columns:
+        adjusted["volume"] = prices["volume"].to_numpy(np.float64, na_value=np.nan) * volume
+    return prices.assign(**adjusted)
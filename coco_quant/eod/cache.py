@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from urllib.error import HTTPError
+
+logger = getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+
+class OfflineCacheMiss(HTTPError):
+    # 504 is what an HTTP cache answers to an only-if-cached request it cannot serve
+    def __init__(self, path: str):
+        super().__init__(path, 504, "not in the response cache (offline)", None, None)
+
+
+def next_close(now: float, close_hour: int = 22) -> float:
+    # end-of-day data is refreshed once a trading day, close_hour is in UTC and leaves time for the provider
+    t = datetime.fromtimestamp(now, timezone.utc)
+    close = t.replace(hour=close_hour, minute=0, second=0, microsecond=0)
+    if close <= t:
+        close += timedelta(days=1)
+    while close.weekday() >= 5:
+        close += timedelta(days=1)
+    return close.timestamp()
+
+
+def next_month(now: float) -> float:
+    t = datetime.fromtimestamp(now, timezone.utc)
+    return (t.replace(day=1, hour=0, minute=0, second=0, microsecond=0) + timedelta(days=32)).replace(day=1).timestamp()
+
+
+# expiry by endpoint, the first path segment of the request. Values are seconds or a function of the write time.
+DEFAULT_TTL = {
+    "eod": next_close,
+    "eod-bulk-last-day": next_close,
+    "fundamentals": DAY,
+    "bulk-fundamentals": DAY,
+    "macro-indicator": next_month,
+    "news": 60 * 60,
+    "economic-events": 60 * 60,
+    "div": next_close,
+    "splits": next_close,
+}
+
+
+class ResponseCache:
+    # on-disk cache of API responses, zlib compressed, with a size bound enforced by LRU eviction.
+    # The key is the request path and parameters, the API token is not part of it.
+    def __init__(self, cache_dir: str, max_bytes: int = 10 * 1024 ** 3, ttl: dict = None, default_ttl: float = DAY,
+                 offline: bool = False, compression_level: int = 6):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.default_ttl = default_ttl
+        self.offline = offline
+        self.compression_level = compression_level
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(f"{cache_dir}/index.db", timeout=60, check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL)""")
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self.__size = self.__conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __reduce__(self) -> tuple:
+        # a worker process opens the same cache directory with its own connection
+        return ResponseCache, (self.cache_dir, self.max_bytes, self.ttl, self.default_ttl, self.offline, self.compression_level)
+
+    @staticmethod
+    def key(path: str, params: list) -> str:
+        return hashlib.sha256("&".join([path] + sorted(params)).encode("utf-8")).hexdigest()
+
+    def __file(self, key: str) -> str:
+        return f"{self.cache_dir}/{key[:2]}/{key}.z"
+
+    def __expires_at(self, path: str, now: float) -> float:
+        ttl = self.ttl.get(path.split("/")[0], self.default_ttl)
+        return ttl(now) if callable(ttl) else now + ttl
+
+    def get(self, path: str, params: list = []) -> bytes:
+        # None when the entry is missing or expired, in offline mode expired entries are served as well
+        key = self.key(path, params)
+        with self.__lock:
+            row = self.__conn.execute("SELECT expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            fresh = row is not None and (self.offline or row[0] > time.time())
+            if fresh:
+                self.__conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        if not fresh:
+            if self.offline:
+                raise OfflineCacheMiss(path)
+            return None
+        try:
+            with open(self.__file(key), "rb") as f:
+                return zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            self.__remove(key)
+            if self.offline:
+                raise OfflineCacheMiss(path)
+            return None
+
+    def put(self, path: str, params: list, data: bytes) -> None:
+        key, now = self.key(path, params), time.time()
+        digest = hashlib.sha256(data).hexdigest()
+        with self.__lock:
+            row = self.__conn.execute("SELECT digest FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] == digest and os.path.exists(self.__file(key)):
+                # revalidated: the payload did not change, only the expiry is extended
+                self.__conn.execute("UPDATE entries SET expires_at = ?, accessed_at = ? WHERE key = ?",
+                                    (self.__expires_at(path, now), now, key))
+                return
+        compressed = zlib.compress(data, self.compression_level)
+        os.makedirs(os.path.dirname(self.__file(key)), exist_ok=True)
+        tmp = f"{self.__file(key)}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp, self.__file(key))
+        with self.__lock:
+            row = self.__conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.__conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                (key, path, len(compressed), digest, self.__expires_at(path, now), now))
+            self.__size += len(compressed) - (row[0] if row is not None else 0)
+        if self.__size > self.max_bytes:
+            self.evict()
+
+    def __remove(self, key: str) -> None:
+        with self.__lock:
+            row = self.__conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.__conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.__size -= row[0] if row is not None else 0
+        try:
+            os.remove(self.__file(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, target_bytes: int = None) -> None:
+        # removes the least recently used entries until the cache is below 90% of max_bytes
+        target_bytes = int(self.max_bytes * 0.9) if target_bytes is None else target_bytes
+        with self.__lock:
+            rows = self.__conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall()
+        removed = 0
+        for key, size in rows:
+            if self.__size <= target_bytes:
+                break
+            self.__remove(key)
+            removed += 1
+        logger.info(f"evicted {removed} entries, size={self.__size}")
+
+    def clear(self) -> None:
+        self.evict(0)
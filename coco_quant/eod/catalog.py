@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import time
+import sqlite3
+import hashlib
+import threading
+import pandas as pd
+from logging import getLogger
+from collections import namedtuple
+
+logger = getLogger(__name__)
+
+CatalogEntry = namedtuple('CatalogEntry', ['dataset', 'symbol', 'exchange', 'min_date', 'max_date', 'rows', 'schema_hash',
+                                           'written_at'])
+
+
+def schema_hash(names: list, types: list) -> str:
+    return hashlib.sha256(",".join(f"{name}:{type_}" for name, type_ in zip(names, types)).encode("utf-8")).hexdigest()[:16]
+
+
+def date_range(dates) -> tuple:
+    # min and max of a date column as naive UTC timestamps
+    dates = pd.to_datetime(pd.Series(dates), errors="coerce", utc=True).dropna()
+    if len(dates) == 0:
+        return None, None
+    return dates.min().tz_convert(None), dates.max().tz_convert(None)
+
+
+class Catalog:
+    # index of the stored tables, one row per data set and symbol in <base_dir>/catalog.db, maintained by every write
+    # so that the symbols, date ranges and row counts are known without listing and opening the files.
+    # The data set is the directory relative to base_dir, e.g. eod_prices or fundamentals/stock/earnings_history.
+    def __init__(self, base_dir: str, date_column: str = "date"):
+        self.base_dir = base_dir
+        self.date_column = date_column
+        os.makedirs(base_dir, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(f"{base_dir}/catalog.db", timeout=60, check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+            dataset TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            exchange TEXT,
+            min_date TEXT,
+            max_date TEXT,
+            rows INTEGER NOT NULL,
+            schema_hash TEXT NOT NULL,
+            written_at REAL NOT NULL,
+            PRIMARY KEY (dataset, symbol))""")
+
+    def __reduce__(self) -> tuple:
+        return Catalog, (self.base_dir, self.date_column)
+
+    def __execute(self, sql: str, params: tuple = ()) -> list:
+        with self.__lock:
+            return self.__conn.execute(sql, params).fetchall()
+
+    def dataset(self, dataset_dir: str) -> str:
+        return os.path.relpath(os.path.normpath(dataset_dir), os.path.normpath(self.base_dir)).replace(os.sep, "/")
+
+    @staticmethod
+    def __entry(row: tuple) -> CatalogEntry:
+        min_date, max_date = [pd.Timestamp(value) if value is not None else None for value in row[3:5]]
+        return CatalogEntry(row[0], row[1], row[2], min_date, max_date, *row[5:])
+
+    def record(self, dataset_dir: str, symbol: str, rows: int, names: list, types: list, dates=None,
+               append: bool = False) -> None:
+        # dates are the values of the date column of the written rows, an append extends the stored range
+        min_date, max_date = date_range(dates) if dates is not None else (None, None)
+        exchange = symbol.rsplit(".", 1)[1] if "." in symbol else None
+        params = (self.dataset(dataset_dir), symbol, exchange, min_date.isoformat() if min_date is not None else None,
+                  max_date.isoformat() if max_date is not None else None, rows, schema_hash(names, types), time.time())
+        if not append:
+            self.__execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", params)
+            return
+        self.__execute("""INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (dataset, symbol) DO UPDATE SET
+                          min_date = COALESCE(MIN(min_date, excluded.min_date), min_date, excluded.min_date),
+                          max_date = COALESCE(MAX(max_date, excluded.max_date), max_date, excluded.max_date),
+                          rows = rows + excluded.rows, written_at = excluded.written_at""", params)
+
+    def record_frame(self, dataset_dir: str, symbol: str, data: pd.DataFrame, append: bool = False) -> None:
+        # the schema is hashed by its arrow types, as stored in the parquet files, or by the pandas dtypes
+        # without pyarrow, which is an optional dependency
+        try:
+            import pyarrow as pa
+        except ImportError:
+            names, types = [str(name) for name in data.columns], [str(dtype) for dtype in data.dtypes]
+        else:
+            schema = pa.Schema.from_pandas(data, preserve_index=False)
+            names, types = schema.names, [str(type_) for type_ in schema.types]
+        dates = data[self.date_column] if self.date_column in data.columns else None
+        self.record(dataset_dir, symbol, len(data), names, types, dates, append)
+
+    def recording_batches(self, dataset_dir: str, symbol: str, batches):
+        # passes arrow record batches through and records them once the last one has been consumed
+        rows, schema, dates = 0, None, []
+        for batch in batches:
+            rows, schema = rows + batch.num_rows, batch.schema
+            if self.date_column in schema.names:
+                dates.extend(date_range(batch.column(self.date_column).to_pandas()))
+            yield batch
+        if schema is not None:
+            self.record(dataset_dir, symbol, rows, schema.names, [str(type_) for type_ in schema.types],
+                        dates if self.date_column in schema.names else None)
+
+    def entry(self, dataset: str, symbol: str) -> CatalogEntry:
+        rows = self.__execute("SELECT * FROM entries WHERE dataset = ? AND symbol = ?", (dataset, symbol))
+        return Catalog.__entry(rows[0]) if len(rows) > 0 else None
+
+    def symbols(self, dataset: str, exchange: str = None) -> list:
+        if exchange is not None:
+            rows = self.__execute("SELECT symbol FROM entries WHERE dataset = ? AND exchange = ? ORDER BY symbol",
+                                  (dataset, exchange))
+        else:
+            rows = self.__execute("SELECT symbol FROM entries WHERE dataset = ? ORDER BY symbol", (dataset,))
+        return [row[0] for row in rows]
+
+    def entries(self, dataset: str = None) -> pd.DataFrame:
+        if dataset is not None:
+            rows = self.__execute("SELECT * FROM entries WHERE dataset = ? ORDER BY symbol", (dataset,))
+        else:
+            rows = self.__execute("SELECT * FROM entries ORDER BY dataset, symbol")
+        data = pd.DataFrame([Catalog.__entry(row) for row in rows], columns=CatalogEntry._fields)
+        data["written_at"] = pd.to_datetime(data["written_at"], unit="s", utc=True)
+        return data
+
+    def stale(self, dataset: str, max_age: float) -> list:
+        # symbols written more than max_age seconds ago
+        rows = self.__execute("SELECT symbol FROM entries WHERE dataset = ? AND written_at < ? ORDER BY symbol",
+                              (dataset, time.time() - max_age))
+        return [row[0] for row in rows]
+
+    def remove(self, dataset: str, symbol: str) -> None:
+        self.__execute("DELETE FROM entries WHERE dataset = ? AND symbol = ?", (dataset, symbol))
+
+    def rebuild(self) -> None:
+        # indexes a one-file-per-symbol tree written before the catalog existed, from the parquet footers only
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        paths = glob.glob(f"{self.base_dir}/**/*.parq", recursive=True)
+        for path in paths:
+            metadata = pq.ParquetFile(path).metadata
+            schema = metadata.schema.to_arrow_schema()
+            # a pandas index stored as a column is not part of the data
+            schema = pa.schema([field for field in schema if not field.name.startswith("__index_level_")])
+            dates = None
+            if self.date_column in schema.names:
+                index = schema.get_field_index(self.date_column)
+                statistics = [metadata.row_group(i).column(index).statistics for i in range(metadata.num_row_groups)]
+                dates = [value for s in statistics if s is not None and s.has_min_max for value in [s.min, s.max]]
+            symbol = os.path.basename(path)[:-len(".parq")]
+            self.record(os.path.dirname(path), symbol, metadata.num_rows, schema.names,
+                        [str(type_) for type_ in schema.types], dates)
+        logger.info(f"catalog rebuilt: {len(paths)} files")
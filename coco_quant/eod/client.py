@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from .executor import RateLimiter
+from .cache import ResponseCache
+from .metrics import Metrics
+from .transport import Transport, PooledTransport, DEFAULT_TIMEOUT
+from .eod_prices import EodPricesData, EOD_HISTORICAL_DATA_URL
+from .financial_news import FinancialNewsData
+from .fundamentals import StockFundamentalsData, EtfFundamentalsData, MutualFundFundamentalsData, IndexFundamentalsData
+
+logger = getLogger(__name__)
+
+FUNDAMENTALS = {
+    "stock": StockFundamentalsData,
+    "etf": EtfFundamentalsData,
+    "mutual_fund": MutualFundFundamentalsData,
+    "index": IndexFundamentalsData,
+}
+
+
+class EodDataClient:
+    # asyncio counterpart of EodDataDownloader that yields the parsed frames instead of writing them, e.g.
+    #     async for symbol, df in client.stream_eod_prices("US"): ...
+    # The requests and the parsing run on a pool of max_in_flight threads, at most max_in_flight symbols are in flight
+    # and at most queue_size parsed results wait for the consumer, so a slow consumer stops new requests.
+    # sink(dataset_dir, symbol, df), e.g. BatchWriter.add, is called on the pool for every yielded frame,
+    # with the directories of the downloader under base_dir.
+    def __init__(self, api_token: str, max_in_flight: int = 8, queue_size: int = None, requests_per_second: float = None,
+                 base_url: str = EOD_HISTORICAL_DATA_URL, timeout: float = DEFAULT_TIMEOUT, transport: Transport = None,
+                 max_retries: int = 3, backoff: float = 1.0, cache: ResponseCache = None, rate_limiter: RateLimiter = None,
+                 sink=None, base_dir: str = ".", metrics: Metrics = None):
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.queue_size = queue_size if queue_size is not None else self.max_in_flight
+        self.sink = sink
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.__executor = ThreadPoolExecutor(self.max_in_flight, thread_name_prefix="coco-quant-client")
+        transport = transport if transport is not None else PooledTransport(timeout, self.max_in_flight)
+        self.__options = dict(rate_limiter=rate_limiter if rate_limiter is not None else RateLimiter(requests_per_second),
+                              base_url=base_url, transport=transport, max_retries=max_retries, backoff=backoff, cache=cache,
+                              metrics=self.metrics)
+        self.__base_dir = base_dir
+        self.__api_token = api_token
+        self.__prices = EodPricesData(base_dir, api_token, **self.__options)
+        self.__news = FinancialNewsData(base_dir, api_token, **self.__options)
+        self.__fundamentals = {}
+
+    def __fundamentals_feed(self, symbol_type: str):
+        if symbol_type not in self.__fundamentals:
+            self.__fundamentals[symbol_type] = FUNDAMENTALS[symbol_type](self.__base_dir, self.__api_token, **self.__options)
+        return self.__fundamentals[symbol_type]
+
+    async def __run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, fn, *args)
+
+    async def exchange_symbols(self, exchange: str) -> list:
+        return await self.__run(self.__prices.exchange_symbols, exchange)
+
+    async def eod_prices(self, symbol: str, last: pd.Timestamp = None) -> pd.DataFrame:
+        return await self.__run(self.__prices.fetch_eod_prices, symbol, last)
+
+    async def eod_latest_prices(self, exchange: str) -> pd.DataFrame:
+        return await self.__run(self.__prices.eod_latest_prices, exchange)
+
+    async def fundamentals(self, symbol: str, symbol_type: str = "stock") -> dict:
+        return await self.__run(self.__fundamentals_feed(symbol_type).fetch_fundamentals, symbol)
+
+    async def financial_news(self, symbol: str, since: pd.Timestamp = None) -> pd.DataFrame:
+        return await self.__run(self.__news.fetch_news, symbol, since)
+
+    def __fetch(self, feed, fetch, sink_dir, symbol: str):
+        # runs on the pool: the request with the retries of the sweeps, the parsing and the sink
+        data = feed.retry_call(fetch, symbol)
+        if data is not None and self.sink is not None:
+            for dataset_dir, df in sink_dir(data):
+                self.sink(dataset_dir, symbol, df)
+        return data
+
+    async def __stream(self, feed, fetch, sink_dir, symbols: list):
+        # (symbol, data) in the order of completion, the symbols whose requests failed are logged and skipped
+        queue = asyncio.Queue(self.queue_size)
+        done = object()
+        pending = iter(symbols)
+
+        async def worker() -> None:
+            try:
+                for symbol in pending:
+                    data = await self.__run(self.__fetch, feed, fetch, sink_dir, symbol)
+                    if data is not None:
+                        await queue.put((symbol, data))
+            except Exception as ex:
+                await queue.put(ex)
+            await queue.put(done)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(self.max_in_flight, len(symbols)))]
+        finished = 0
+        try:
+            while finished < len(workers):
+                item = await queue.get()
+                if item is done:
+                    finished += 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            # the consumer stopped early or failed, the requests already running on the pool are not awaited
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def __symbols(self, exchange: str, symbols: list) -> list:
+        return symbols if symbols is not None else await self.exchange_symbols(exchange)
+
+    async def stream_eod_prices(self, exchange: str = None, symbols: list = None):
+        prices_dir = f"{self.__prices.base_dir}/eod_prices"
+        async for item in self.__stream(self.__prices, self.__prices.fetch_eod_prices, lambda df: [(prices_dir, df)],
+                                        await self.__symbols(exchange, symbols)):
+            yield item
+
+    async def stream_fundamentals(self, exchange: str = None, symbols: list = None, symbol_type: str = "stock"):
+        # (symbol, tables by name)
+        feed = self.__fundamentals_feed(symbol_type)
+        async for item in self.__stream(feed, feed.fetch_fundamentals,
+                                        lambda tables: [(f"{feed.base_dir}/{name}", df) for name, df in tables.items()],
+                                        await self.__symbols(exchange, symbols)):
+            yield item
+
+    async def stream_financial_news(self, exchange: str = None, symbols: list = None):
+        news_dir = self.__news.base_dir
+        async for item in self.__stream(self.__news, self.__news.fetch_news, lambda df: [(news_dir, df)],
+                                        await self.__symbols(exchange, symbols)):
+            yield item
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
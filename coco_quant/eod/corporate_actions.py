@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+from logging import getLogger
+from .eod_prices import EodData
+from .reader import EodDataReader
+from .writer import BatchWriter
+from .adjustments import adjustment_factors, split_ratio, FACTOR_COLUMNS
+from .schema import apply_schema, SPLITS_SCHEMA, DIVIDENDS_SCHEMA
+
+logger = getLogger(__name__)
+
+SPLITS = "splits"
+DIVIDENDS = "dividends"
+ADJUSTMENT_FACTORS = "adjustment_factors"
+
+
+def parse_splits(data: pd.DataFrame) -> pd.DataFrame:
+    data.columns = data.columns.str.lower()
+    if "split" not in data.columns:
+        return None
+    data["ratio"] = split_ratio(data["split"])
+    return apply_schema(data, SPLITS_SCHEMA)
+
+
+def parse_dividends(data: pd.DataFrame) -> pd.DataFrame:
+    data.columns = data.columns.str.lower()
+    if "value" not in data.columns:
+        return None
+    if "unadjustedvalue" not in data.columns:
+        data["unadjustedvalue"] = data["value"]
+    return apply_schema(data, DIVIDENDS_SCHEMA)
+
+
+class CorporateActionsData(EodData):
+    # the splits and dividends of every symbol as fetched, in splits/ and dividends/, and the cumulative adjustment
+    # factors they imply, in adjustment_factors/. The adjusted bars are computed from the stored ones and the factors
+    # when they are read, so a new action rewrites the factors of its symbol only and no price history.
+    # A symbol takes two requests, so a resumed sweep cannot tell from the first payload that it is unchanged.
+    SINGLE_PAYLOAD = False
+
+    def __init__(self, base_dir: str, api_token: str, factors_batch_size: int = 500, **kwargs):
+        super().__init__(base_dir, api_token, ['fetch_splits', 'fetch_dividends', 'corporate_actions',
+                                               'corporate_actions_exchange', 'corporate_actions_last_day',
+                                               'update_factors', 'factors_batch_size'], **kwargs)
+        self.factors_batch_size = factors_batch_size
+
+    def fetch_splits(self, symbol: str) -> pd.DataFrame:
+        data = self.request_json(f"splits/{symbol}", ["fmt=json"])
+        with self.timed("splits", "parse") as timing:
+            data = parse_splits(pd.DataFrame.from_records(data))
+            timing.rows = len(data) if data is not None else 0
+        return data
+
+    def fetch_dividends(self, symbol: str) -> pd.DataFrame:
+        data = self.request_json(f"div/{symbol}", ["fmt=json"])
+        with self.timed("div", "parse") as timing:
+            data = parse_dividends(pd.DataFrame.from_records(data))
+            timing.rows = len(data) if data is not None else 0
+        return data
+
+    def corporate_actions(self, symbol: str, factors: bool = True) -> None:
+        # the whole action history of the symbol replaces the stored one
+        for name, data in [(SPLITS, self.fetch_splits(symbol)), (DIVIDENDS, self.fetch_dividends(symbol))]:
+            if data is not None and len(data) > 0:
+                self.to_parquet(symbol, data.assign(symbol=symbol), name)
+        if factors:
+            self.update_factors([symbol])
+
+    def corporate_actions_exchange(self, exchange: str, shard: list = None) -> dict:
+        # the factors of the symbols are computed together once all actions are stored
+        fetched = []
+
+        def fetch(symbol: str) -> None:
+            self.corporate_actions(symbol, False)
+            fetched.append(symbol)
+
+        summary = self.bulk_request(exchange, fetch, name="corporate_actions", shard=shard)
+        self.update_factors(fetched)
+        return summary
+
+    def __merge(self, name: str, symbol: str, data: pd.DataFrame) -> None:
+        # an action of a day replaces the stored one of the same day
+        stored = self.storage.read(f"{self.base_dir}/{name}", symbol)
+        if stored is not None:
+            data = pd.concat([stored, data[[column for column in stored.columns if column in data.columns]]],
+                             ignore_index=True)
+        self.to_parquet(symbol, data.drop_duplicates("date", keep="last").sort_values("date", ignore_index=True), name)
+
+    def corporate_actions_last_day(self, exchange: str, day: str = None) -> list:
+        # the splits and dividends of the exchange with the ex-date day, the last trading day by default, in two
+        # requests; only the factors of the symbols with a new action are computed again
+        params = ["fmt=json"] + ([f"date={day}"] if day is not None else [])
+        actions = {}
+        for name, type_, parse in [(SPLITS, "splits", parse_splits), (DIVIDENDS, "dividends", parse_dividends)]:
+            data = pd.DataFrame.from_records(self.request_json(f"eod-bulk-last-day/{exchange}", [f"type={type_}", *params]))
+            if "dividend" in data.columns and "value" not in data.columns:
+                data = data.rename(columns={"dividend": "value"})
+            if len(data) == 0:
+                continue
+            symbols = data["code"].astype(str) + "." + exchange
+            data = parse(data.drop(columns=["code", "exchange"], errors="ignore"))
+            if data is not None:
+                actions[name] = {symbol: rows for symbol, rows in data.assign(symbol=symbols.to_numpy()).groupby("symbol")}
+        for name, frames in actions.items():
+            for symbol, data in frames.items():
+                self.__merge(name, symbol, data)
+        symbols = sorted({symbol for frames in actions.values() for symbol in frames})
+        self.update_factors(symbols)
+        logger.info(f"corporate-actions:{exchange}: new actions of {len(symbols)} symbols")
+        return symbols
+
+    def update_factors(self, symbols: list) -> None:
+        # the factors of factors_batch_size symbols at a time, computed over their stored actions and closes
+        reader = EodDataReader(self.base_dir, self.storage, self.max_workers, catalog=self.catalog)
+        writer = BatchWriter(self.storage, self.factors_batch_size, catalog=self.catalog, metrics=self.metrics,
+                             profile=self.profile)
+        try:
+            for start in range(0, len(symbols), self.factors_batch_size):
+                batch = symbols[start:start + self.factors_batch_size]
+                splits = reader.read(SPLITS, batch, columns=["symbol", "date", "ratio"])
+                dividends = reader.read(DIVIDENDS, batch, columns=["symbol", "date", "unadjustedvalue"])
+                # the closes are needed before the dividends' ex-dates only
+                paying = sorted(set(dividends["symbol"])) if dividends is not None else []
+                prices = reader.read("eod_prices", paying, columns=["symbol", "date", "close"]) if len(paying) > 0 else None
+                with self.timed(ADJUSTMENT_FACTORS, "parse") as timing:
+                    factors = adjustment_factors(prices, splits, dividends)
+                    timing.rows = len(factors)
+                for symbol, data in factors.groupby("symbol", sort=False):
+                    writer.add(f"{self.base_dir}/{ADJUSTMENT_FACTORS}", symbol, data[FACTOR_COLUMNS].reset_index(drop=True))
+        finally:
+            writer.close()
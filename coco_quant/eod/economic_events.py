@@ -1,20 +1,88 @@
 # -*- coding: utf-8 -*-
 
-import json
 import pandas as pd
 from logging import getLogger
 from datetime import datetime
 from .eod_prices import EodData
+from .executor import run_concurrently
 
 logger = getLogger(__name__)
 
+# an event is identified by these columns, a refresh replaces the stored event
+EVENT_KEY = ["date", "country", "type"]
+
+# the events were stored in a single file before they were partitioned by month
+LEGACY_FILE = "economic_events"
+
+
+def date_windows(from_, to_, days: int) -> list:
+    # consecutive (first, last) days of at most days days covering from_ to to_
+    start, end = pd.Timestamp(from_).normalize(), pd.Timestamp(to_).normalize()
+    windows = []
+    while start <= end:
+        last = min(start + pd.Timedelta(days=days - 1), end)
+        windows.append((start, last))
+        start = last + pd.Timedelta(days=1)
+    return windows
+
 
 class EconomicEventsData(EodData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(f"{base_dir}/economic_events", api_token)
+    # the events are stored as one file per month, economic_events/<yyyy-mm>.parq. A request range is fetched as
+    # windows of window_days days, concurrently, and only the months of the range are rewritten.
+    def __init__(self, base_dir: str, api_token: str, window_days: int = 7, limit: int = 1000, **kwargs):
+        super().__init__(f"{base_dir}/economic_events", api_token, **kwargs)
+        self.window_days = window_days
+        self.limit = limit
+
+    def __fetch_window(self, first: pd.Timestamp, last: pd.Timestamp) -> list:
+        data = self.request_json("economic-events", [f"from={first.date()}", f"to={last.date()}", f"limit={self.limit}"])
+        if len(data) >= self.limit and last > first:
+            # the API cut the result at the limit, the window is fetched again in halves
+            middle = first + (last - first) // 2
+            logger.info(f"economic-events:{first.date()}:{last.date()}: {len(data)} events, splitting the window")
+            return self.__fetch_window(first, middle.normalize()) + self.__fetch_window(middle.normalize() + pd.Timedelta(days=1), last)
+        return data
+
+    def fetch_events(self, from_: datetime, to_: datetime) -> pd.DataFrame:
+        windows = {f"{first.date()}:{last.date()}": (first, last) for first, last in date_windows(from_, to_, self.window_days)}
+        results = run_concurrently(lambda key: self.retry_call(lambda key: self.__fetch_window(*windows[key]), key),
+                                   list(windows), self.max_workers)
+        failed = [key for key, result in zip(windows, results) if result is None]
+        if len(failed) > 0:
+            logger.error(f"economic-events: {len(failed)} of {len(windows)} windows failed: {failed}")
+        data = pd.DataFrame([event for result in results if result is not None for event in result])
+        if len(data) == 0:
+            return data
+        data["date"] = pd.to_datetime(data["date"], errors="coerce")
+        return data.dropna(subset=["date"]).drop_duplicates(EVENT_KEY, keep="last", ignore_index=True)
+
+    def __legacy(self) -> pd.DataFrame:
+        stored = self.storage.read(self.base_dir, LEGACY_FILE)
+        if stored is not None:
+            stored["date"] = pd.to_datetime(stored["date"], errors="coerce")
+        return stored
+
+    def __merge_month(self, month: str, data: pd.DataFrame) -> None:
+        stored = self.storage.read(self.base_dir, month)
+        if stored is not None:
+            data = pd.concat([stored, data], ignore_index=True)
+        data = data.drop_duplicates(EVENT_KEY, keep="last")
+        self.to_parquet(month, data.sort_values(EVENT_KEY, ignore_index=True))
 
     def economic_events(self, from_: datetime, to_: datetime) -> None:
-        data = self.request("economic-events", [f"from={from_}", f"to={to_}"])
-        data = json.loads(data)
-        data = pd.DataFrame(data)
-        self.to_parquet("economic_events", data)
+        data = self.fetch_events(from_, to_)
+        legacy = self.__legacy()
+        if legacy is not None:
+            # every month of the single file is moved to its partition, the fetched events take precedence
+            data = pd.concat([legacy.dropna(subset=["date"]), data], ignore_index=True)
+        if len(data) == 0:
+            logger.info(f"economic-events:{from_}:{to_}: no events")
+            return
+        months = {month: rows for month, rows in data.groupby(data["date"].dt.strftime("%Y-%m"), sort=True)}
+        run_concurrently(lambda month: self.__merge_month(month, months[month]), list(months), self.max_workers)
+        if legacy is not None:
+            # the single file is moved once, with either storage
+            self.storage.delete(self.base_dir, LEGACY_FILE)
+            if self.catalog is not None:
+                self.catalog.remove(self.catalog.dataset(self.base_dir), LEGACY_FILE)
+        logger.info(f"economic-events:{from_}:{to_}: {len(data)} events in {len(months)} months")
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import threading
+import importlib
 from datetime import datetime
-from .eod_prices import EodPricesData
-from .sentiments import SentimentsData
-from .macro_indicators import MacroIndicatorsData
-from .economic_events import EconomicEventsData
-from .financial_news import FinancialNewsData
-from .fundamentals import StockFundamentalsData, EtfFundamentalsData, MutualFundFundamentalsData, IndexFundamentalsData
+from logging import getLogger
+from .executor import RateLimiter, SharedRateLimiter, run_in_processes
+from .manifest import JobManifest
+from .cache import ResponseCache
+from .metrics import Metrics
+from .transport import Transport, PooledTransport, DEFAULT_TIMEOUT, EOD_HISTORICAL_DATA_URL
+
+logger = getLogger(__name__)
 
 
 class EodDataAPI:
@@ -19,63 +23,181 @@ class EodDataAPI:
     MACRO_INDICATORS = "macro_indicators"
     ECONOMIC_EVENTS = "economic_events"
     FINANCIAL_NEWS = "financial_news"
+    CORPORATE_ACTIONS = "corporate_actions"
 
 
 class EodDataDownloader:
-    def __init__(self, base_dir: str, api_token: str):
-        self.__feed = {
-            EodDataAPI.EOD_PRICES: EodPricesData(base_dir, api_token),
-            EodDataAPI.STOCK_FUNDAMENTALS: StockFundamentalsData(base_dir, api_token),
-            EodDataAPI.ETF_FUNDAMENTALS: EtfFundamentalsData(base_dir, api_token),
-            EodDataAPI.INDEX_FUNDAMENTALS: IndexFundamentalsData(base_dir, api_token),
-            EodDataAPI.MUTUAL_FUND_FUNDAMENTALS: MutualFundFundamentalsData(base_dir, api_token),
-            EodDataAPI.SENTIMENTS: SentimentsData(base_dir, api_token),
-            EodDataAPI.MACRO_INDICATORS: MacroIndicatorsData(base_dir, api_token),
-            EodDataAPI.ECONOMIC_EVENTS: EconomicEventsData(base_dir, api_token),
-            EodDataAPI.FINANCIAL_NEWS: FinancialNewsData(base_dir, api_token),
-        }
-
-    def eod_prices(self, symbol: str) -> None:
-        self.__feed[EodDataAPI.EOD_PRICES].eod_prices(symbol)
+    # the module and class of the feed of every API and whether its sweeps buffer their writes: the feeds, their
+    # modules and pandas are loaded on first use, so that a job needing one feed does not pay for the others
+    FEEDS = {
+        EodDataAPI.EOD_PRICES: (".eod_prices", "EodPricesData", True),
+        EodDataAPI.STOCK_FUNDAMENTALS: (".fundamentals", "StockFundamentalsData", True),
+        EodDataAPI.ETF_FUNDAMENTALS: (".fundamentals", "EtfFundamentalsData", True),
+        EodDataAPI.INDEX_FUNDAMENTALS: (".fundamentals", "IndexFundamentalsData", True),
+        EodDataAPI.MUTUAL_FUND_FUNDAMENTALS: (".fundamentals", "MutualFundFundamentalsData", True),
+        EodDataAPI.SENTIMENTS: (".sentiments", "SentimentsData", False),
+        EodDataAPI.MACRO_INDICATORS: (".macro_indicators", "MacroIndicatorsData", False),
+        EodDataAPI.ECONOMIC_EVENTS: (".economic_events", "EconomicEventsData", False),
+        EodDataAPI.FINANCIAL_NEWS: (".financial_news", "FinancialNewsData", False),
+        EodDataAPI.CORPORATE_ACTIONS: (".corporate_actions", "CorporateActionsData", False),
+    }
+
+    def __init__(self, base_dir: str, api_token: str, max_workers: int = 1, requests_per_second: float = None,
+                 base_url: str = EOD_HISTORICAL_DATA_URL, timeout: float = DEFAULT_TIMEOUT, transport: Transport = None,
+                 storage=None, streaming: bool = False, resume: bool = False, max_retries: int = 3, backoff: float = 1.0,
+                 cache: ResponseCache = None, write_batch_size: int = 64, background_writer: bool = False,
+                 processes: int = 1, rate_limiter: RateLimiter = None, catalog: bool = True, metrics: Metrics = None,
+                 profile: str = None):
+        # with processes > 1 the exchange sweeps shard the symbols across worker processes,
+        # each with its own downloader created from these arguments and max_workers threads
+        self.__processes = processes
+        self.__config = dict(base_dir=base_dir, api_token=api_token, max_workers=max_workers, base_url=base_url, timeout=timeout,
+                             transport=transport, storage=storage, streaming=streaming, resume=resume, max_retries=max_retries,
+                             backoff=backoff, cache=cache, write_batch_size=write_batch_size, background_writer=background_writer,
+                             catalog=catalog, profile=profile)
+        if rate_limiter is None and processes > 1:
+            import multiprocessing
+
+            rate_limiter = SharedRateLimiter(requests_per_second, context=multiprocessing.get_context("spawn"))
+        self.__rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(requests_per_second)
+        # with resume, the exchange sweeps record their progress in a manifest and continue where they stopped
+        manifest = JobManifest(f"{base_dir}/manifest.db") if resume else None
+        # every write is indexed in <base_dir>/catalog.db, opened with the first feed
+        self.__catalog, self.__catalog_enabled = None, catalog
+        # per endpoint and stage timings of all feeds, the worker processes report theirs with their summaries
+        self.metrics = metrics if metrics is not None else Metrics()
+        # one rate limiter for all feeds since the API quota is per token,
+        # and one transport so that every feed reuses the same keep-alive connections
+        transport = transport if transport is not None else PooledTransport(timeout, max(max_workers, 1))
+        self.__options = dict(max_workers=max_workers, rate_limiter=self.__rate_limiter, base_url=base_url,
+                              transport=transport, storage=storage, streaming=streaming, manifest=manifest,
+                              max_retries=max_retries, backoff=backoff, cache=cache, metrics=self.metrics, profile=profile)
+        # the fundamentals and price sweeps buffer the tables of write_batch_size symbols per write
+        self.__writer_options = dict(write_batch_size=write_batch_size, background_writer=background_writer)
+        self.__feed = {}
+        self.__lock = threading.RLock()
+
+    @property
+    def catalog(self):
+        with self.__lock:
+            if self.__catalog is None and self.__catalog_enabled:
+                from .catalog import Catalog
+
+                self.__catalog = Catalog(self.__config["base_dir"])
+            return self.__catalog
+
+    def feed(self, api: str):
+        # the feed is created on first use, feeds are shared by the threads of a sweep
+        with self.__lock:
+            if api not in self.__feed:
+                module, name, buffered = EodDataDownloader.FEEDS[api]
+                options = dict(self.__options, catalog=self.catalog, **(self.__writer_options if buffered else {}))
+                feed_class = getattr(importlib.import_module(module, __package__), name)
+                self.__feed[api] = feed_class(self.__config["base_dir"], self.__config["api_token"], **options)
+            return self.__feed[api]
+
+    def __sweep(self, api: str, method: str, name: str, exchange: str, *args) -> dict:
+        feed = self.feed(api)
+        if self.__processes <= 1:
+            return getattr(feed, method)(exchange, *args)
+        # the symbols are registered once here and dealt round-robin to the processes,
+        # which share the rate limit of this downloader
+        symbols = feed.sweep_symbols(exchange, name)
+        shards = [symbols[i::self.__processes] for i in range(min(self.__processes, len(symbols)))]
+        tasks = [(api, method, exchange, args, shard) for shard in shards]
+        summaries = run_in_processes(sweep_shard, tasks, len(shards), start_worker, (self.__config, self.__rate_limiter)) if len(tasks) > 0 else []
+        for worker_summary in summaries:
+            self.metrics.merge(worker_summary.pop("metrics"))
+        from .eod_prices import merge_summaries
+
+        summary = merge_summaries(summaries)
+        for symbol, error in summary["errors"].items():
+            logger.error(f"{name}:{exchange}: {error}")
+        logger.info(f"{name}:{exchange}: processes={len(shards)}, symbols={summary['symbols']}, done={summary['done']}, "
+                    f"unchanged={summary['unchanged']}, failed={summary['failed']}")
+        return summary
+
+    def eod_prices(self, symbol: str, incremental: bool = False) -> None:
+        self.feed(EodDataAPI.EOD_PRICES).eod_prices(symbol, incremental)
+
+    def eod_prices_exchange(self, exchange: str, incremental: bool = False) -> dict:
+        return self.__sweep(EodDataAPI.EOD_PRICES, "eod_prices_exchange",
+                            "eod_prices_incremental" if incremental else "eod_prices", exchange, incremental)
+
+    def eod_prices_exchange_last_day(self, exchange: str) -> None:
+        self.feed(EodDataAPI.EOD_PRICES).eod_prices_exchange_last_day(exchange)
 
     def eod_prices_country(self, exchange: str) -> None:
-        self.__feed[EodDataAPI.EOD_PRICES].eod_prices_exchange(exchange)
+        self.eod_prices_exchange(exchange)
 
     def stock_fundamentals(self, symbol: str) -> None:
-        self.__feed[EodDataAPI.STOCK_FUNDAMENTALS].fundamentals(symbol)
+        self.feed(EodDataAPI.STOCK_FUNDAMENTALS).fundamentals(symbol)
 
-    def stock_fundamentals_exchange(self, exchange: str) -> None:
-        self.__feed[EodDataAPI.STOCK_FUNDAMENTALS].fundamentals_exchange(exchange)
+    def stock_fundamentals_exchange(self, exchange: str, bulk: bool = False, page_size: int = 500) -> dict:
+        # with bulk, the exchange is read in pages from bulk-fundamentals, in this process since a page is one request
+        if bulk:
+            return self.feed(EodDataAPI.STOCK_FUNDAMENTALS).bulk_fundamentals_exchange(exchange, page_size)
+        return self.__sweep(EodDataAPI.STOCK_FUNDAMENTALS, "fundamentals_exchange", "fundamentals", exchange)
 
     def etf_fundamentals(self, symbol: str) -> None:
-        self.__feed[EodDataAPI.ETF_FUNDAMENTALS].fundamentals(symbol)
+        self.feed(EodDataAPI.ETF_FUNDAMENTALS).fundamentals(symbol)
 
-    def etf_fundamentals_exchange(self, exchange: str) -> None:
-        self.__feed[EodDataAPI.ETF_FUNDAMENTALS].fundamentals_exchange(exchange)
+    def etf_fundamentals_exchange(self, exchange: str) -> dict:
+        return self.__sweep(EodDataAPI.ETF_FUNDAMENTALS, "fundamentals_exchange", "fundamentals", exchange)
 
     def mutual_fund_fundamentals(self, symbol: str) -> None:
-        self.__feed[EodDataAPI.MUTUAL_FUND_FUNDAMENTALS].fundamentals(symbol)
+        self.feed(EodDataAPI.MUTUAL_FUND_FUNDAMENTALS).fundamentals(symbol)
 
-    def mutual_fund_fundamentals_exchange(self, exchange: str) -> None:
-        self.__feed[EodDataAPI.MUTUAL_FUND_FUNDAMENTALS].fundamentals_exchange(exchange)
+    def mutual_fund_fundamentals_exchange(self, exchange: str) -> dict:
+        return self.__sweep(EodDataAPI.MUTUAL_FUND_FUNDAMENTALS, "fundamentals_exchange", "fundamentals", exchange)
 
     def index_fundamentals(self, symbol: str) -> None:
-        self.__feed[EodDataAPI.INDEX_FUNDAMENTALS].fundamentals(symbol)
+        self.feed(EodDataAPI.INDEX_FUNDAMENTALS).fundamentals(symbol)
 
     def sentiments(self, symbol: str) -> None:
-        self.__feed[EodDataAPI.SENTIMENTS].sentiments(symbol)
+        self.feed(EodDataAPI.SENTIMENTS).sentiments(symbol)
 
-    def sentiments_exchange(self, exchange: str) -> None:
-        self.__feed[EodDataAPI.SENTIMENTS].sentiments_exchange(exchange)
+    def sentiments_exchange(self, exchange: str) -> dict:
+        return self.__sweep(EodDataAPI.SENTIMENTS, "sentiments_exchange", "sentiments", exchange)
 
     def macro_indicators(self, exchange: str) -> None:
-        self.__feed[EodDataAPI.MACRO_INDICATORS].macro_indicators_exchange(exchange)
+        self.feed(EodDataAPI.MACRO_INDICATORS).macro_indicators_exchange(exchange)
+
+    def macro_indicators_countries(self, countries: list) -> None:
+        self.feed(EodDataAPI.MACRO_INDICATORS).macro_indicators_countries(countries)
 
     def economic_events(self, from_: datetime, to_: datetime) -> None:
-        self.__feed[EodDataAPI.ECONOMIC_EVENTS].economic_events(from_, to_)
+        self.feed(EodDataAPI.ECONOMIC_EVENTS).economic_events(from_, to_)
+
+    def financial_news(self, symbol: str, incremental: bool = False) -> None:
+        self.feed(EodDataAPI.FINANCIAL_NEWS).financial_news(symbol, incremental)
+
+    def financial_news_exchange(self, exchange: str, incremental: bool = False) -> dict:
+        return self.__sweep(EodDataAPI.FINANCIAL_NEWS, "financial_news_exchange",
+                            "financial_news_incremental" if incremental else "financial_news", exchange, incremental)
+
+    def corporate_actions(self, symbol: str) -> None:
+        self.feed(EodDataAPI.CORPORATE_ACTIONS).corporate_actions(symbol)
+
+    def corporate_actions_exchange(self, exchange: str) -> dict:
+        return self.__sweep(EodDataAPI.CORPORATE_ACTIONS, "corporate_actions_exchange", "corporate_actions", exchange)
+
+    def corporate_actions_last_day(self, exchange: str, day: str = None) -> list:
+        return self.feed(EodDataAPI.CORPORATE_ACTIONS).corporate_actions_last_day(exchange, day)
+
+
+# the downloader of a worker process of a multi-process sweep
+worker = None
+
+
+def start_worker(config: dict, rate_limiter: RateLimiter) -> None:
+    global worker
+    worker = EodDataDownloader(**config, rate_limiter=rate_limiter)
 
-    def financial_news(self, symbol: str) -> None:
-        self.__feed[EodDataAPI.FINANCIAL_NEWS].financial_news(symbol)
 
-    def financial_news_exchange(self, exchange: str) -> None:
-        self.__feed[EodDataAPI.FINANCIAL_NEWS].financial_news_exchange(exchange)
+def sweep_shard(task: tuple) -> dict:
+    api, method, exchange, args, shard = task
+    worker.metrics.reset()
+    summary = getattr(worker.feed(api), method)(exchange, *args, shard=shard)
+    summary["metrics"] = worker.metrics.snapshot()
+    return summary
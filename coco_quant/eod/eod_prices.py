@@ -2,28 +2,65 @@
 
 import os
 import json
+import time
+import random
 import socket
+import hashlib
+import threading
 import pandas as pd
-import urllib.request as req
 from logging import getLogger
 from urllib.error import HTTPError
 from http.client import IncompleteRead
 from collections import namedtuple
-from io import StringIO
+from types import SimpleNamespace
+from datetime import date
+from io import BytesIO
+from contextlib import nullcontext
+from .executor import RateLimiter, run_concurrently
+from .transport import Transport, PooledTransport, EOD_HISTORICAL_DATA_URL
+from .storage import ParquetFileStorage
+from .writer import BatchWriter
+from .manifest import JobManifest, JobStatus
+from .cache import ResponseCache, OfflineCacheMiss
+from .catalog import Catalog
+from .metrics import Metrics, Timing
+from .profiles import StorageProfile, storage_profile, apply_profile, parquet_options
+from .schema import TableSchema, EOD_PRICES_SCHEMA, EOD_BULK_SCHEMA
+from .ingest import read_csv, read_csv_arrow, csv_batches
 
 KeyValue = namedtuple('KeyValue', ['key', 'value'])
 
-EOD_HISTORICAL_DATA_URL = "https://eodhistoricaldata.com/api"
+RETRY_HTTP_CODES = (429, 500, 502, 503, 504)
 
 logger = getLogger(__name__)
 
 
-def parse_csv(data: str, kv: KeyValue = None) -> pd.DataFrame:
-    # remove the last line
-    df = pd.read_csv(StringIO(data), sep=',', header=0)[:-1]
+def sweep_summary(symbols: list, results: list) -> dict:
+    # results are the (status, error) pairs of the symbols
+    summary = {"symbols": len(symbols), JobStatus.DONE: 0, JobStatus.UNCHANGED: 0, JobStatus.FAILED: 0, "errors": {}}
+    for symbol, (status, error) in zip(symbols, results):
+        summary[status] += 1
+        if error is not None:
+            summary["errors"][symbol] = error
+    return summary
+
+
+def merge_summaries(summaries: list) -> dict:
+    merged = sweep_summary([], [])
+    for summary in summaries:
+        for key in ["symbols", JobStatus.DONE, JobStatus.UNCHANGED, JobStatus.FAILED]:
+            merged[key] += summary[key]
+        merged["errors"].update(summary["errors"])
+    return merged
+
+
+def parse_csv(data: bytes, kv: KeyValue = None, schema: TableSchema = None) -> pd.DataFrame:
+    # parses the response bytes as they are, without decoding them into one string first,
+    # and removes the last line while reading
+    data = data.encode("utf-8") if isinstance(data, str) else data
+    df = read_csv(BytesIO(data), schema)
     if kv is not None:
         df[kv.key] = kv.value
-    df.columns = df.columns.str.lower()
     return df
 
 
@@ -32,69 +69,352 @@ def parse_json(data: dict, key: str, sub_key: str = None) -> pd.DataFrame:
         return
     key, data = (sub_key, data[key]) if sub_key is not None else (key, data)
     if key in data:
-        df = None
         data = data[key]
         if sub_key is not None:
-            for key in data.keys():
-                tmp = pd.DataFrame.from_dict([data[key]])
-                df = pd.concat([df, tmp], ignore_index=True) if df is not None else tmp
+            # one record per entry, built in a single pass instead of concatenating row by row
+            records = list(data.values()) if isinstance(data, dict) else list(data)
+            if len(records) == 0:
+                return
+            df = pd.DataFrame.from_records(records)
         else:
             df = pd.DataFrame.from_dict([data])
         df.columns = df.columns.str.lower()
         return df
 
 
+class PayloadUnchanged(Exception):
+    pass
+
+
 class EodData:
-    def __init__(self, base_dir: str, api_token: str, exclude_list: list = []):
+    # the work on a symbol is one request, whose payload tells a resumed sweep whether the symbol changed
+    SINGLE_PAYLOAD = True
+    # the public methods of every feed class, dir() is walked once per class
+    __methods = {}
+
+    def __init__(self, base_dir: str, api_token: str, exclude_list: list = [], max_workers: int = 1,
+                 rate_limiter: RateLimiter = None, base_url: str = EOD_HISTORICAL_DATA_URL, transport: Transport = None,
+                 storage=None, streaming: bool = False, manifest: JobManifest = None, max_retries: int = 3,
+                 backoff: float = 1.0, cache: ResponseCache = None, catalog: Catalog = None, metrics: Metrics = None,
+                 profile: StorageProfile = None):
         self.base_dir = base_dir
         self.api_token = api_token
-        self.exclude_list = ['base_dir', 'api_token', 'get_methods', 'to_parquet', 'request', 'bulk_request', 'eod_latest_prices', 'exclude_list']
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.base_url = base_url
+        self.transport = transport if transport is not None else PooledTransport()
+        self.storage = storage if storage is not None else ParquetFileStorage()
+        self.streaming = streaming
+        self.manifest = manifest
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.catalog = catalog
+        self.metrics = metrics
+        # dtypes, codec and row groups of the written tables, a profile or its name
+        self.profile = storage_profile(profile)
+        self.__local = threading.local()
+        self.exclude_list = ['base_dir', 'api_token', 'get_methods', 'to_parquet', 'request', 'bulk_request', 'eod_latest_prices', 'exclude_list',
+                             'max_workers', 'rate_limiter', 'base_url', 'transport', 'storage', 'exchange_symbols',
+                             'streaming', 'request_bytes', 'request_stream', 'manifest', 'max_retries', 'backoff', 'cache',
+                             'sweep_symbols', 'catalog', 'retry_call', 'metrics', 'timed', 'request_json',
+                             'profile', 'SINGLE_PAYLOAD', 'batch_writer', 'stored']
         self.exclude_list = self.exclude_list + exclude_list
 
-    def request(self, path: str, params: list = []) -> str:
+    def __url(self, path: str, params: list) -> str:
+        self.rate_limiter.acquire()
         logger.info(f"relative-url:{path}:param:{params}")
         params = "&" + "&".join(params) if len(params) > 0 else ""
-        url = f"{EOD_HISTORICAL_DATA_URL}/{path}?api_token={self.api_token}{params}"
-        with req.urlopen(url) as ret:
-            return ret.read().decode("utf-8")
+        return f"{self.base_url}/{path}?api_token={self.api_token}{params}"
+
+    def timed(self, endpoint: str, stage: str):
+        # context manager timing a stage of a download, a no-op without metrics
+        return self.metrics.timed(endpoint, stage) if self.metrics is not None else nullcontext(Timing())
+
+    def request_bytes(self, path: str, params: list = []) -> bytes:
+        endpoint = self.__local.endpoint = path.split("/")[0]
+        data = self.cache.get(path, params) if self.cache is not None else None
+        if data is not None:
+            logger.debug(f"cached:relative-url:{path}:param:{params}")
+            if self.metrics is not None:
+                self.metrics.observe(endpoint, "request", 0.0, len(data), status="cached")
+        else:
+            url = self.__url(path, params)
+            # the wait for the rate limiter is not part of the request time
+            with self.timed(endpoint, "request") as timing:
+                data = self.transport.get(url)
+                # the compressed size as received, the decode stage counts the decoded bytes
+                timing.bytes = self.transport.received(data)
+            if self.cache is not None:
+                self.cache.put(path, params, data)
+        self.__check_payload(data)
+        return data
+
+    def request_json(self, path: str, params: list = []):
+        data = self.request_bytes(path, params)
+        with self.timed(path.split("/")[0], "decode") as timing:
+            timing.bytes = len(data)
+            return json.loads(data)
+
+    def stored(self, symbol: str) -> bool:
+        # whether the data of the symbol is on disk, a symbol whose payload did not change is skipped only then
+        return self.storage.exists(f"{self.base_dir}/", symbol)
+
+    def __check_payload(self, data: bytes) -> None:
+        # inside a resumable sweep, stops processing a symbol whose payload is the same as in the previous run.
+        # The hash covers the storage backend and profile, a payload stored differently is written again.
+        job = getattr(self.__local, "job", None)
+        if job is None or job.content_hash is not None or not self.SINGLE_PAYLOAD:
+            return
+        content_hash = hashlib.sha256(data)
+        content_hash.update(f"{type(self.storage).__name__}:{self.profile.name if self.profile is not None else ''}".encode())
+        job.content_hash = content_hash.hexdigest()
+        if job.content_hash == job.previous_hash and self.stored(job.symbol):
+            raise PayloadUnchanged()
+
+    def request_stream(self, path: str, params: list = []):
+        # context manager over a binary file-like of the response body, cached responses are read as a whole
+        if self.cache is not None:
+            return nullcontext(BytesIO(self.request_bytes(path, params)))
+        self.__local.endpoint = path.split("/")[0]
+        return self.transport.stream(self.__url(path, params))
+
+    def request(self, path: str, params: list = []) -> str:
+        return self.request_bytes(path, params).decode("utf-8")
+
+    def __retry_delay(self, attempt: int, ex: Exception) -> float:
+        # exponential backoff with full jitter, a Retry-After header is honoured when present
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+        retry_after = ex.headers.get("Retry-After") if isinstance(ex, HTTPError) and ex.headers is not None else None
+        return max(delay, float(retry_after)) if retry_after is not None and retry_after.isdigit() else delay
 
-    def bulk_request(self, exchange: str, fn) -> None:
-        for index, row in self.eod_latest_prices(exchange).iterrows():
-            symbol = f"{row['code']}.{row['ex']}"
+    def __call(self, fn, symbol: str, job: str) -> str:
+        self.__local.job = SimpleNamespace(symbol=symbol, content_hash=None, previous_hash=None)
+        if job is not None:
+            self.__local.job.previous_hash = self.manifest.content_hash(job, symbol)
+            self.manifest.start(job, symbol)
+        try:
+            fn(symbol)
+        except PayloadUnchanged:
+            logger.info(f"unchanged: symbol={symbol}")
+            if job is not None:
+                self.manifest.done(job, symbol, self.__local.job.content_hash, JobStatus.UNCHANGED)
+            return JobStatus.UNCHANGED
+        finally:
+            content_hash = self.__local.job.content_hash
+            self.__local.job = None
+        if job is not None:
+            self.manifest.done(job, symbol, content_hash)
+        return JobStatus.DONE
+
+    @staticmethod
+    def __describe(ex: Exception, symbol: str) -> tuple:
+        # error message and whether the request is worth retrying
+        if isinstance(ex, HTTPError):
+            retry = ex.code in RETRY_HTTP_CODES and not isinstance(ex, OfflineCacheMiss)
+            return f"HTTPError: code={ex.code}, symbol={symbol}, reason={ex.reason}", retry
+        if isinstance(ex, IncompleteRead):
+            return f"IncompleteRead: symbol={symbol}", True
+        if isinstance(ex, json.decoder.JSONDecodeError):
+            return f"json.decoder.JSONDecodeError: symbol={symbol}", False
+        return f"socket.error: symbol={symbol}, error={ex}", True
+
+    def __bulk_call(self, fn, symbol: str, job: str = None) -> tuple:
+        # status and error of the symbol
+        for attempt in range(self.max_retries + 1):
             try:
-                fn(symbol)
-            except HTTPError as ex:
-                logger.error(f"HTTPError: code={ex.code}, symbol={symbol}, reason={ex.reason}")
-            except socket.error:
-                logger.error(f"socket.error: symbol={symbol}")
-            except IncompleteRead:
-                logger.error(f"IncompleteRead: symbol={symbol}")
-            except json.decoder.JSONDecodeError:
-                logger.error(f"json.decoder.JSONDecodeError: symbol={symbol}")
+                return self.__call(fn, symbol, job), None
+            except (HTTPError, socket.error, IncompleteRead, json.decoder.JSONDecodeError) as ex:
+                error, retry = EodData.__describe(ex, symbol)
+                if not retry or attempt == self.max_retries:
+                    break
+                delay = self.__retry_delay(attempt, ex)
+                if self.metrics is not None:
+                    self.metrics.retry(getattr(self.__local, "endpoint", None) or "unknown")
+            logger.warning(f"{error}, retry in {delay:.1f}s")
+            time.sleep(delay)
+        logger.error(error)
+        if job is not None:
+            self.manifest.failed(job, symbol, error)
+        return JobStatus.FAILED, error
+
+    def retry_call(self, fn, symbol: str):
+        # fn(symbol) with the retries of the sweeps, None when every attempt failed
+        result = []
+        self.__bulk_call(lambda symbol: result.append(fn(symbol)), symbol)
+        return result[0] if len(result) > 0 else None
+
+    def exchange_symbols(self, exchange: str) -> list:
+        data = self.eod_latest_prices(exchange)
+        return [f"{code}.{ex}" for code, ex in zip(data['code'], data['ex'])]
+
+    def __job(self, exchange: str, name: str) -> str:
+        return f"{type(self).__name__}.{name}:{exchange}" if self.manifest is not None else None
+
+    def sweep_symbols(self, exchange: str, name: str, symbols: list = None, resume: bool = True) -> list:
+        # the symbols a sweep has to process, with a manifest the unfinished ones of the last run
+        # or else a new run is registered
+        job = self.__job(exchange, name)
+        if job is not None:
+            unfinished = self.manifest.unfinished(job) if resume else []
+            if len(unfinished) > 0:
+                logger.info(f"{job}: resuming {len(unfinished)} symbols")
+                return unfinished
+        symbols = self.exchange_symbols(exchange) if symbols is None else symbols
+        if job is not None:
+            self.manifest.register(job, symbols)
+        return symbols
+
+    def bulk_request(self, exchange: str, fn, symbols: list = None, name: str = None, resume: bool = True,
+                     shard: list = None) -> dict:
+        # a shard is a part of a sweep whose symbols were assigned, and registered, by sweep_symbols in another process
+        name = name or fn.__name__
+        job = self.__job(exchange, name)
+        symbols = shard if shard is not None else self.sweep_symbols(exchange, name, symbols, resume)
+        # the whole sweep is one sample of the sweep stage, by job name
+        with self.timed(name, "sweep") as timing:
+            results = run_concurrently(lambda symbol: self.__bulk_call(fn, symbol, job), symbols, self.max_workers)
+            summary = sweep_summary(symbols, results)
+            timing.rows = summary[JobStatus.DONE]
+        if job is not None:
+            logger.info(f"{job}: {self.manifest.summary(job)}")
+        else:
+            logger.info(f"{name}:{exchange}: done={summary[JobStatus.DONE]}, unchanged={summary[JobStatus.UNCHANGED]}, "
+                        f"failed={summary[JobStatus.FAILED]}")
+        return summary
 
     def eod_latest_prices(self, exchange: str) -> pd.DataFrame:
-        data = self.request(f"eod-bulk-last-day/{exchange}")
-        return parse_csv(data)
+        if self.streaming:
+            with self.request_stream(f"eod-bulk-last-day/{exchange}") as stream:
+                return read_csv_arrow(stream, EOD_BULK_SCHEMA)
+        data = self.request_bytes(f"eod-bulk-last-day/{exchange}")
+        with self.timed("eod-bulk-last-day", "parse") as timing:
+            data = parse_csv(data, schema=EOD_BULK_SCHEMA)
+            timing.rows = len(data)
+        return data
 
     def to_parquet(self, symbol: str, data: pd.DataFrame, parent_dir: str = "") -> None:
-        os.makedirs(f"{self.base_dir}/{parent_dir}", exist_ok=True)
-        data.to_parquet(f"{self.base_dir}/{parent_dir}/{symbol}.parq")
+        dataset_dir = f"{self.base_dir}/{parent_dir}"
+        data = apply_profile(self.profile, dataset_dir, data)
+        with self.timed(os.path.basename(os.path.normpath(dataset_dir)), "write") as timing:
+            self.storage.write(dataset_dir, symbol, data, parquet_options(self.profile))
+            timing.rows = len(data)
+        if self.catalog is not None:
+            self.catalog.record_frame(dataset_dir, symbol, data)
+
+    def batch_writer(self, batch_size: int, background: bool = False) -> BatchWriter:
+        # the tables of many symbols are written together. With a manifest a symbol is recorded as done
+        # only once its tables are on disk, so nothing is buffered in that case.
+        buffered = self.manifest is None
+        return BatchWriter(self.storage, batch_size if buffered else 1, buffered and background, catalog=self.catalog,
+                           metrics=self.metrics, profile=self.profile)
 
     def get_methods(self) -> list:
         # skip the private methods
-        return list(filter(lambda x: ('__' not in x) & (x not in self.exclude_list), dir(self)))
+        methods = EodData.__methods.get(type(self))
+        if methods is None:
+            methods = EodData.__methods[type(self)] = list(filter(lambda x: ('__' not in x) & (x not in self.exclude_list), dir(self)))
+        return list(methods)
 
 
 class EodPricesData(EodData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(base_dir, api_token)
+    def __init__(self, base_dir: str, api_token: str, write_batch_size: int = 64, background_writer: bool = False,
+                 **kwargs):
+        super().__init__(base_dir, api_token, ['write_batch_size', 'background_writer'], **kwargs)
+        self.write_batch_size = write_batch_size
+        self.background_writer = background_writer
         logger.info(f"base_dir:{self.base_dir}")
 
-    def eod_prices(self, symbol: str) -> None:
-        data = self.request(f"eod/{symbol}")
-        data = parse_csv(data, KeyValue("symbol", symbol))
-        data["date"] = pd.to_datetime(data["date"])
-        self.to_parquet(symbol, data, "eod_prices")
+    def stored(self, symbol: str) -> bool:
+        return self.storage.exists(f"{self.base_dir}/eod_prices", symbol)
+
+    def last_date(self, symbol: str) -> pd.Timestamp:
+        if self.catalog is not None:
+            entry = self.catalog.entry(self.catalog.dataset(f"{self.base_dir}/eod_prices"), symbol)
+            if entry is not None:
+                return entry.max_date
+        stored = self.storage.read(f"{self.base_dir}/eod_prices", symbol, ["date"])
+        return stored["date"].max() if stored is not None and len(stored) > 0 else None
+
+    def append_prices(self, symbol: str, data: pd.DataFrame, last: pd.Timestamp = None) -> bool:
+        # returns False when there is no stored history to append to, last is the stored last date when known
+        last = last if last is not None else self.last_date(symbol)
+        if last is None:
+            return False
+        data = apply_profile(self.profile, f"{self.base_dir}/eod_prices", data.loc[data["date"] > last])
+        if len(data) > 0:
+            with self.timed("eod_prices", "write") as timing:
+                self.storage.append(f"{self.base_dir}/eod_prices", symbol, data, parquet_options(self.profile))
+                timing.rows = len(data)
+            if self.catalog is not None:
+                self.catalog.record_frame(f"{self.base_dir}/eod_prices", symbol, data, append=True)
+        return True
+
+    def fetch_eod_prices(self, symbol: str, last: pd.Timestamp = None) -> pd.DataFrame:
+        # the history of the symbol, after the day last when given
+        params = [f"from={(last + pd.Timedelta(days=1)).date()}", f"to={date.today()}"] if last is not None else []
+        data = self.request_bytes(f"eod/{symbol}", params)
+        with self.timed("eod", "parse") as timing:
+            data = parse_csv(data, KeyValue("symbol", symbol), EOD_PRICES_SCHEMA)
+            timing.rows = len(data)
+        return data
+
+    def eod_prices(self, symbol: str, incremental: bool = False, writer: BatchWriter = None) -> None:
+        # the full histories go to the writer when given, the appended bars are written at once
+        last = self.last_date(symbol) if incremental else None
+        if last is None and self.streaming:
+            # full histories are written row group by row group while the response arrives
+            # the request, parsing and writing overlap, they are timed as one stream stage
+            with self.timed("eod", "stream"), self.request_stream(f"eod/{symbol}") as stream:
+                batches = csv_batches(stream, EOD_PRICES_SCHEMA, {"symbol": symbol})
+                if self.catalog is not None:
+                    batches = self.catalog.recording_batches(f"{self.base_dir}/eod_prices", symbol, batches)
+                self.storage.write_batches(f"{self.base_dir}/eod_prices", symbol, batches)
+            return
+        data = self.fetch_eod_prices(symbol, last)
+        if last is not None and self.append_prices(symbol, data):
+            return
+        if writer is not None:
+            writer.add(f"{self.base_dir}/eod_prices", symbol, data)
+        else:
+            self.to_parquet(symbol, data, "eod_prices")
+
+    def eod_prices_exchange(self, exchange: str, incremental: bool = False, shard: list = None) -> dict:
+        # the histories of write_batch_size symbols are written together, with the partitioned storage as one file
+        # per partition instead of one per symbol. The incremental sweep is a job of its own: the full history
+        # request of a symbol without stored bars has the payload hash of the full sweep.
+        writer = self.batch_writer(self.write_batch_size, self.background_writer)
+        try:
+            return self.bulk_request(exchange, lambda symbol: self.eod_prices(symbol, incremental, writer),
+                                     name="eod_prices_incremental" if incremental else "eod_prices", shard=shard)
+        finally:
+            writer.close()
+
+    def eod_prices_exchange_last_day(self, exchange: str) -> None:
+        # merge the bulk last-day bars into the stored histories with a single request,
+        # only the symbols without a stored history are downloaded in full. A history that ends before the business
+        # day preceding its bar would keep a hole the incremental updates never fill, its missing bars are requested
+        # instead; an exchange holiday costs a request, not a hole.
+        data = self.eod_latest_prices(exchange)
+        data["symbol"] = data["code"].astype(str) + "." + data["ex"].astype(str)
+        data = data[[column for column in [*EOD_PRICES_SCHEMA.columns, "symbol"] if column in data.columns]]
+        bars = {symbol: bar for symbol, bar in data.groupby("symbol", sort=False)}
+        missing, behind = [], []
+
+        def merge(symbol: str) -> None:
+            last = self.last_date(symbol)
+            if last is None:
+                missing.append(symbol)
+            elif pd.Timestamp(last) < bars[symbol]["date"].min() - pd.offsets.BDay(1):
+                behind.append(symbol)
+            else:
+                self.append_prices(symbol, bars[symbol], last)
 
-    def eod_prices_exchange(self, exchange: str) -> None:
-        self.bulk_request(exchange, self.eod_prices)
+        run_concurrently(merge, list(bars), self.max_workers)
+        if len(missing) > 0:
+            logger.info(f"{exchange}: no stored history for {len(missing)} symbols")
+            self.bulk_request(exchange, self.eod_prices, missing, "eod_prices_last_day")
+        if len(behind) > 0:
+            logger.info(f"{exchange}: {len(behind)} stored histories end before the previous business day")
+            self.bulk_request(exchange, lambda symbol: self.eod_prices(symbol, True), behind,
+                              "eod_prices_last_day_incremental")
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    # token bucket shared by every feed, so the combined traffic stays within the API quota
+    def __init__(self, requests_per_second: float = None, burst: int = 1):
+        self.requests_per_second = requests_per_second
+        self.burst = max(int(burst), 1)
+        self.__tokens = float(self.burst)
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.requests_per_second:
+            return
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.requests_per_second)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.requests_per_second
+            time.sleep(wait)
+
+
+class SharedRateLimiter(RateLimiter):
+    # the same token bucket in shared memory, for the worker processes of a sweep. It is handed to the
+    # processes when they start, e.g. through the initializer arguments of a process pool.
+    # time.monotonic() is system-wide, so the processes agree on the clock.
+    def __init__(self, requests_per_second: float = None, burst: int = 1, context=None):
+        self.requests_per_second = requests_per_second
+        self.burst = max(int(burst), 1)
+        if context is None:
+            import multiprocessing
+
+            context = multiprocessing.get_context()
+        # tokens and the time of the last update, guarded by the lock of the array
+        self.__state = context.Array("d", [float(self.burst), time.monotonic()])
+
+    def acquire(self) -> None:
+        if not self.requests_per_second:
+            return
+        while True:
+            with self.__state.get_lock():
+                now = time.monotonic()
+                tokens = min(self.burst, self.__state[0] + (now - self.__state[1]) * self.requests_per_second)
+                self.__state[1] = now
+                if tokens >= 1:
+                    self.__state[0] = tokens - 1
+                    return
+                self.__state[0] = tokens
+                wait = (1 - tokens) / self.requests_per_second
+            time.sleep(wait)
+
+
+def run_concurrently(fn, items: list, max_workers: int = 1) -> list:
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fn, items))
+
+
+def run_in_processes(fn, items: list, processes: int, initializer=None, initargs: tuple = ()) -> list:
+    # fn, the items and the initializer arguments are pickled, the processes are spawned
+    # so that they do not inherit the threads, connections and locks of the parent
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=initializer,
+                             initargs=initargs) as executor:
+        return list(executor.map(fn, items))
@@ -1,24 +1,58 @@
 # -*- coding: utf-8 -*-
 
-import json
 import pandas as pd
 from logging import getLogger
 from .eod_prices import EodData
 from .sentiments import SentimentsData
+from .news import NewsStore
 
 logger = getLogger(__name__)
 
 
 class FinancialNewsData(EodData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(f"{base_dir}/financial_news", api_token)
-
-    def financial_news(self, symbol: str) -> None:
-        data = self.request("news", [f"s={symbol}"])
-        data = json.loads(data)
-        data = pd.DataFrame.from_dict(data)
-        data = SentimentsData.parse_sentiments(data)
-        self.to_parquet(symbol, data)
-
-    def financial_news_exchange(self, exchange: str) -> None:
-        self.bulk_request(exchange, self.financial_news)
+    def __init__(self, base_dir: str, api_token: str, **kwargs):
+        super().__init__(f"{base_dir}/financial_news", api_token, **kwargs)
+        # the store of a running incremental sweep
+        self.__store = None
+
+    def news_store(self) -> NewsStore:
+        # with a manifest a symbol is recorded as done only once its news are on disk, so nothing is buffered
+        flush_rows = 0 if self.manifest is not None else 100000
+        return NewsStore(self.base_dir, flush_rows=flush_rows, catalog=self.catalog, metrics=self.metrics)
+
+    def fetch_news(self, symbol: str, since: pd.Timestamp = None) -> pd.DataFrame:
+        # the news of the symbol with their sentiment scores, from the day of since when given
+        params = [f"s={symbol}"] + ([f"from={since.date()}"] if since is not None else [])
+        data = self.request_json("news", params)
+        with self.timed("news", "parse") as timing:
+            data = SentimentsData.parse_sentiments(pd.DataFrame.from_dict(data))
+            timing.rows = len(data)
+        return data
+
+    def stored(self, symbol: str) -> bool:
+        store = self.__store
+        return store.last_date(symbol) is not None if store is not None else super().stored(symbol)
+
+    def __append_news(self, symbol: str, store: NewsStore) -> None:
+        # only the days from the last stored item on are requested, the store drops the items it already has
+        data = self.fetch_news(symbol, store.last_date(symbol))
+        logger.debug(f"{symbol}: {store.add(symbol, data)} new items")
+
+    def financial_news(self, symbol: str, incremental: bool = False) -> None:
+        if incremental:
+            with self.news_store() as store:
+                self.__append_news(symbol, store)
+            return
+        self.to_parquet(symbol, self.fetch_news(symbol))
+
+    def financial_news_exchange(self, exchange: str, incremental: bool = False, shard: list = None) -> dict:
+        if not incremental:
+            return self.bulk_request(exchange, self.financial_news, shard=shard)
+        # a job of its own, the payload hashes of the full sweep are those of other requests
+        with self.news_store() as store:
+            self.__store = store
+            try:
+                return self.bulk_request(exchange, lambda symbol: self.__append_news(symbol, store),
+                                         name="financial_news_incremental", shard=shard)
+            finally:
+                self.__store = None
@@ -1,148 +1,162 @@
 # -*- coding: utf-8 -*-
 
-import json
-import pandas as pd
 from logging import getLogger
-from .eod_prices import EodData, parse_json
+from collections import namedtuple
+from .eod_prices import EodData, parse_json, merge_summaries
+from .writer import BatchWriter
+from .schema import apply_schema, EARNINGS_SCHEMA, FINANCIALS_SCHEMA
 
 logger = getLogger(__name__)
 
+# a table of the fundamentals JSON: parse_json(data[parents...], key, sub_key) is stored under name
+FundamentalsTable = namedtuple('FundamentalsTable', ['name', 'parents', 'key', 'sub_key', 'schema'])
 
-class FundamentalsData(EodData):
-    def __init__(self, base_dir: str, api_token: str, symbol_type: str):
-        super().__init__(f"{base_dir}/fundamentals/{symbol_type}", api_token, ['fundamentals', 'fundamentals_exchange', 'process_data'])
-
-    def process_data(self, symbol: str, data: dict, key: str, sub_key: str = None, path_: str = None, conv_fn: str = None) -> None:
-        data = parse_json(data, key, sub_key)
-        if conv_fn is not None:
-            data = conv_fn(data)
-        path = path_
-        if path is None:
-            path = f"{key.lower()}_{sub_key.lower()}" if sub_key is not None else key.lower()
-        if data is not None:
-            self.to_parquet(symbol, data, path)
-        else:
-            logger.warning(f"{symbol}: no {path} data")
-
-    def general(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "General")
-
-    def fundamentals(self, symbol: str) -> None:
-        data = self.request(f"fundamentals/{symbol}")
-        data = json.loads(data)
-        for name in self.get_methods():
-            fn = getattr(self, name)
-            fn(symbol, data)
-
-    def fundamentals_exchange(self, exchange: str):
-        self.bulk_request(exchange, self.fundamentals)
-
-
-class StockFundamentalsData(FundamentalsData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(base_dir, api_token, "stock")
-
-    def highlights(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "Highlights")
-
-    def valuation(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "Valuation")
 
-    def share_stats(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "ShareStats")
+def table(key: str, sub_key: str = None, parents: tuple = (), schema=None, name: str = None) -> FundamentalsTable:
+    # the name follows the directory convention, API-name_sub-node
+    name = name if name is not None else f"{key.lower()}_{sub_key.lower()}" if sub_key is not None else key.lower()
+    return FundamentalsTable(name, parents, key, sub_key, schema)
 
-    def technicals(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "Technicals")
 
-    def analyst_ratings(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "AnalystRatings")
-
-    def earnings(self, symbol: str, data: dict) -> None:
-        def conv_fn(data: pd.DataFrame):
-            for column in data.columns:
-                if column in ['date', 'reportdate']:
-                    data[column] = pd.to_datetime(data[column])
-                elif column not in ['period', 'currency', 'beforeaftermarket']:
-                    data[column] = pd.to_numeric(data[column])
-            return data
-
-        for sub_key in ["History", "Trend", "Annual"]:
-            self.process_data(symbol, data, "Earnings", sub_key, conv_fn = conv_fn)
-
-    def financials(self, symbol: str, data: dict) -> None:
-        def conv_fn(data: pd.DataFrame):
-            for column in data.columns:
-                if column in ['date', 'filing_date']:
-                    data[column] = pd.to_datetime(data[column])
-                elif column not in ['currency_symbol']:
-                    data[column] = pd.to_numeric(data[column])
-            return data
+class FundamentalsData(EodData):
+    TABLES = (table("General"),)
+
+    def __init__(self, base_dir: str, api_token: str, symbol_type: str, write_batch_size: int = 64,
+                 background_writer: bool = False, **kwargs):
+        super().__init__(f"{base_dir}/fundamentals/{symbol_type}", api_token,
+                         ['fundamentals', 'fundamentals_exchange', 'extract_tables', 'fetch_fundamentals', 'TABLES',
+                          'write_batch_size', 'background_writer', 'bulk_fundamentals_exchange',
+                          'fetch_bulk_fundamentals'], **kwargs)
+        self.write_batch_size = write_batch_size
+        self.background_writer = background_writer
+
+    def stored(self, symbol: str) -> bool:
+        # the first table of the registry, General, is stored for every symbol
+        return self.storage.exists(f"{self.base_dir}/{self.TABLES[0].name}", symbol)
+
+    def extract_tables(self, symbol: str, data: dict) -> dict:
+        # every table of the registry in one pass over the JSON, by table name
+        tables = {}
+        for entry in self.TABLES:
+            node = data
+            for parent in entry.parents:
+                node = node.get(parent) or {}
+            df = apply_schema(parse_json(node, entry.key, entry.sub_key), entry.schema)
+            if df is not None:
+                tables[entry.name] = df
+            else:
+                logger.warning(f"{symbol}: no {entry.name} data")
+        return tables
+
+    def __parse(self, endpoint: str, symbol: str, data: dict) -> dict:
+        with self.timed(endpoint, "parse") as timing:
+            tables = self.extract_tables(symbol, data)
+            timing.rows = sum(len(df) for df in tables.values())
+        return tables
+
+    def fetch_fundamentals(self, symbol: str) -> dict:
+        return self.__parse("fundamentals", symbol, self.request_json(f"fundamentals/{symbol}"))
+
+    def fetch_bulk_fundamentals(self, exchange: str, offset: int, limit: int) -> list:
+        # the fundamentals JSON of a page of the exchange's symbols, version 1.2 has the format of fundamentals/{symbol}
+        data = self.request_json(f"bulk-fundamentals/{exchange}", [f"offset={offset}", f"limit={limit}", "version=1.2"])
+        return list(data.values()) if isinstance(data, dict) else list(data)
+
+    def fundamentals(self, symbol: str, writer: BatchWriter = None, data: dict = None) -> None:
+        # data is the symbol's fundamentals JSON when it was already fetched, e.g. by a bulk page
+        tables = self.fetch_fundamentals(symbol) if data is None else self.__parse("bulk-fundamentals", symbol, data)
+        for name, df in tables.items():
+            if writer is not None:
+                writer.add(f"{self.base_dir}/{name}", symbol, df)
+            else:
+                self.to_parquet(symbol, df, name)
+
+    def fundamentals_exchange(self, exchange: str, shard: list = None) -> dict:
+        writer = self.batch_writer(self.write_batch_size, self.background_writer)
+        try:
+            return self.bulk_request(exchange, lambda symbol: self.fundamentals(symbol, writer), name="fundamentals", shard=shard)
+        finally:
+            writer.close()
+
+    def bulk_fundamentals_exchange(self, exchange: str, page_size: int = 500, resume: bool = True) -> dict:
+        # the exchange is read in pages of page_size symbols from bulk-fundamentals instead of one request per symbol,
+        # each page is parsed and written as a sweep over its symbols. The symbols missing from the pages, or left
+        # when a page failed, are requested one by one at the end.
+        symbols = self.sweep_symbols(exchange, "fundamentals", resume=resume)
+        pending, summaries, offset = set(symbols), [], 0
+        writer = self.batch_writer(self.write_batch_size, self.background_writer)
+        try:
+            while len(pending) > 0:
+                items = self.retry_call(lambda offset: self.fetch_bulk_fundamentals(exchange, offset, page_size), offset)
+                if items is None:
+                    logger.error(f"bulk-fundamentals:{exchange}: page at offset {offset} failed, stopping the bulk requests")
+                    break
+                # the items without a code are skipped, they still count for the end of the paging
+                page = {f"{item['General']['Code']}.{exchange}": item for item in items
+                        if (item.get("General") or {}).get("Code")}
+                found = [symbol for symbol in page if symbol in pending]
+                pending.difference_update(found)
+                summaries.append(self.bulk_request(exchange, lambda symbol: self.fundamentals(symbol, writer, page[symbol]),
+                                                   name="fundamentals", shard=found))
+                if len(items) < page_size:
+                    break
+                offset += page_size
+            missing = [symbol for symbol in symbols if symbol in pending]
+            if len(missing) > 0:
+                logger.info(f"bulk-fundamentals:{exchange}: {len(missing)} of {len(symbols)} symbols not in the bulk pages")
+                summaries.append(self.bulk_request(exchange, lambda symbol: self.fundamentals(symbol, writer),
+                                                   name="fundamentals", shard=missing))
+        finally:
+            writer.close()
+        summary = merge_summaries(summaries)
+        summary["symbols"] = len(symbols)
+        return summary
 
-        for key in ["Balance_Sheet", "Cash_Flow", "Income_Statement"]:
-            for sub_key in ["quarterly", "yearly"]:
-                path = f"financials_{key.lower()}_{sub_key.lower()}"
-                self.process_data(symbol, data["Financials"], key, sub_key, path, conv_fn)
 
-    def outstanding_shares(self, symbol: str, data: dict) -> None:
-        for sub_key in ["annual", "quarterly"]:
-            self.process_data(symbol, data, "outstandingShares", sub_key)
+class StockFundamentalsData(FundamentalsData):
+    TABLES = FundamentalsData.TABLES + (
+        table("Highlights"),
+        table("Valuation"),
+        table("SharesStats"),
+        table("Technicals"),
+        table("AnalystRatings"),
+        *[table("Earnings", sub_key, schema=EARNINGS_SCHEMA) for sub_key in ["History", "Trend", "Annual"]],
+        *[table(key, sub_key, ("Financials",), FINANCIALS_SCHEMA, f"financials_{key.lower()}_{sub_key}")
+          for key in ["Balance_Sheet", "Cash_Flow", "Income_Statement"] for sub_key in ["quarterly", "yearly"]],
+        *[table("outstandingShares", sub_key) for sub_key in ["annual", "quarterly"]],
+    )
+
+    def __init__(self, base_dir: str, api_token: str, **kwargs):
+        super().__init__(base_dir, api_token, "stock", **kwargs)
 
 
 class EtfFundamentalsData(FundamentalsData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(base_dir, api_token, "etf")
-
-    def technicals(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "Technicals")
+    TABLES = FundamentalsData.TABLES + (
+        table("Technicals"),
+        table("ETF_Data"),
+        *[table("ETF_Data", sub_key) for sub_key in ["Asset_Allocation", "World_Regions", "Sector_Weights",
+                                                     "Fixed_Income", "Top_10_Holdings"]],
+    )
 
-    def etf_data(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "ETF_Data")
-
-    def etf_data_asset_allocation(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "ETF_Data", "Asset_Allocation")
-
-    def etf_data_world_regions(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "ETF_Data", "World_Regions")
-
-    def etf_data_sector_weights(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "ETF_Data", "Sector_Weights")
-
-    def etf_data_fixed_income(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "ETF_Data", "Fixed_Income")
-
-    def etf_data_top_10_holdings(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "ETF_Data", "Top_10_Holdings")
+    def __init__(self, base_dir: str, api_token: str, **kwargs):
+        super().__init__(base_dir, api_token, "etf", **kwargs)
 
 
 class MutualFundFundamentalsData(FundamentalsData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(base_dir, api_token, "mutual_fund")
-
-    def mutual_fund_data(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "MutualFund_Data")
-
-    def mutual_fund_data_asset_allocation(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "MutualFund_Data", "Asset_Allocation")
-
-    def mutual_fund_data_value_growth(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "MutualFund_Data", "Value_Growth")
-
-    def mutual_fund_data_top_holdings(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "MutualFund_Data", "Top_Holdings")
-
-    def mutual_fund_data_market_capitalization(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "MutualFund_Data", "Market_Capitalization")
-
-    def mutual_fund_data_sector_weights(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "MutualFund_Data", "Sector_Weights")
+    TABLES = FundamentalsData.TABLES + (
+        table("MutualFund_Data"),
+        *[table("MutualFund_Data", sub_key) for sub_key in ["Asset_Allocation", "Value_Growth", "Top_Holdings",
+                                                            "Market_Capitalization", "Sector_Weights", "World_Regions"]],
+    )
 
-    def mutual_fund_data_world_regions(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "MutualFund_Data", "World_Regions")
+    def __init__(self, base_dir: str, api_token: str, **kwargs):
+        super().__init__(base_dir, api_token, "mutual_fund", **kwargs)
 
 
 class IndexFundamentalsData(FundamentalsData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(base_dir, api_token, "index")
+    TABLES = FundamentalsData.TABLES + (
+        table("Components"),
+    )
 
-    def components(self, symbol: str, data: dict) -> None:
-        self.process_data(symbol, data, "Components")
+    def __init__(self, base_dir: str, api_token: str, **kwargs):
+        super().__init__(base_dir, api_token, "index", **kwargs)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import io
+import pandas as pd
+from .schema import TableSchema, pandas_dtypes, arrow_types
+
+BLOCK_SIZE = 1024 * 1024
+
+
+class DropLastLine(io.RawIOBase):
+    # passes a byte stream through except for its last line, without buffering the whole stream
+    def __init__(self, raw):
+        self.raw = raw
+        self.__ready = memoryview(b"")
+        self.__pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while len(self.__ready) == 0:
+            chunk = self.raw.read(BLOCK_SIZE)
+            if not chunk:
+                # the pending bytes are the last line
+                return 0
+            data = self.__pending + chunk
+            # keep the last line, complete or not, until more data or the end of the stream arrives
+            cut = data.rfind(b"\n", 0, len(data) - 1) + 1
+            self.__ready, self.__pending = memoryview(data)[:cut], data[cut:]
+        size = min(len(buffer), len(self.__ready))
+        buffer[:size] = self.__ready[:size]
+        self.__ready = self.__ready[size:]
+        return size
+
+
+def csv_body(stream, drop_last_line: bool = True) -> tuple:
+    # lower-cased column names and a stream positioned after the header line
+    names = stream.readline().decode("utf-8").strip().lower().split(",")
+    body = io.BufferedReader(DropLastLine(stream), BLOCK_SIZE) if drop_last_line else stream
+    return names, body
+
+
+def read_csv(stream, schema: TableSchema = None, drop_last_line: bool = True) -> pd.DataFrame:
+    names, body = csv_body(stream, drop_last_line)
+    dtypes = pandas_dtypes(schema, names)
+    dates = [name for name, dtype in dtypes.items() if dtype.startswith("datetime64")]
+    dtypes = {name: dtype for name, dtype in dtypes.items() if name not in dates}
+    return pd.read_csv(body, sep=",", header=None, names=names, dtype=dtypes, parse_dates=dates)
+
+
+def open_csv_arrow(stream, schema: TableSchema = None, drop_last_line: bool = True):
+    # record batch reader over the stream, the parsing happens while the data arrives
+    import pyarrow.csv as csv
+
+    names, body = csv_body(stream, drop_last_line)
+    read_options = csv.ReadOptions(column_names=names, block_size=BLOCK_SIZE)
+    convert_options = csv.ConvertOptions(column_types=arrow_types(schema, names),
+                                         timestamp_parsers=["%Y-%m-%d", "%Y-%m-%d %H:%M:%S", csv.ISO8601])
+    parse_options = csv.ParseOptions(invalid_row_handler=lambda row: "skip")
+    return csv.open_csv(body, read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+
+
+def read_csv_arrow(stream, schema: TableSchema = None, drop_last_line: bool = True) -> pd.DataFrame:
+    return open_csv_arrow(stream, schema, drop_last_line).read_all().to_pandas()
+
+
+def csv_batches(stream, schema: TableSchema = None, columns: dict = {}):
+    # record batches with constant columns appended, e.g. the symbol of a price history
+    import pyarrow as pa
+
+    for batch in open_csv_arrow(stream, schema):
+        if batch.num_rows == 0:
+            continue
+        for name, value in columns.items():
+            batch = batch.append_column(name, pa.array([value] * batch.num_rows))
+        yield batch
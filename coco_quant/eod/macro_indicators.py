@@ -1,25 +1,65 @@
 # -*- coding: utf-8 -*-
 
 import json
+import hashlib
 import pandas as pd
 from logging import getLogger
 from .eod_prices import EodData
+from .executor import run_concurrently
+from .manifest import JobManifest
+from .schema import apply_schema, MACRO_INDICATORS_SCHEMA
 
 logger = getLogger(__name__)
 
 
 class MacroIndicatorsData(EodData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(f"{base_dir}/macro_indicators", api_token, ['macro_indicators_exchange'])
+    def __init__(self, base_dir: str, api_token: str, **kwargs):
+        super().__init__(f"{base_dir}/macro_indicators", api_token, ['macro_indicators_exchange', 'macro_indicators_countries'], **kwargs)
 
     def macro_indicators_exchange(self, exchange: str) -> None:
         for name in self.get_methods():
-            data = self.request(f"macro-indicator/{exchange}", [f"indicator={name}"])
-            data = json.loads(data)
+            data = self.request_json(f"macro-indicator/{exchange}", [f"indicator={name}"])
             data = pd.DataFrame(data)
             fn = getattr(self, name)
             fn(exchange, data)
 
+    def macro_indicators_countries(self, countries: list) -> None:
+        # fetches every (country, indicator) pair concurrently and keeps all of them in one long table,
+        # macro_indicators.parq with country, indicator, date and value columns. A pair of the table whose payload
+        # has the hash of the previous refresh is skipped, the hashes are recorded once the table is written.
+        manifest = self.manifest if self.manifest is not None else JobManifest(f"{self.base_dir}/manifest.db")
+        job = f"{type(self).__name__}.macro_indicators:countries"
+        pairs = [f"{country}:{name}" for country in countries for name in self.get_methods()]
+        stored = self.storage.read(f"{self.base_dir}/", "macro_indicators")
+        keys = stored["country"].astype(str) + ":" + stored["indicator"].astype(str) if stored is not None else None
+        in_table = set(keys) if keys is not None else set()
+        fetched, hashes = {}, {}
+
+        def fetch(pair: str) -> None:
+            country, name = pair.split(":")
+            payload = self.request_bytes(f"macro-indicator/{country}", [f"indicator={name}"])
+            content_hash = hashlib.sha256(payload).hexdigest()
+            if pair in in_table and content_hash == manifest.content_hash(job, pair):
+                return
+            data = pd.DataFrame.from_records(json.loads(payload), columns=["Date", "Value"])
+            fetched[pair] = pd.DataFrame({"country": country, "indicator": name, "date": data["Date"], "value": data["Value"]})
+            hashes[pair] = content_hash
+
+        with self.timed("macro_indicators", "sweep") as timing:
+            run_concurrently(lambda pair: self.retry_call(fetch, pair), pairs, self.max_workers)
+            timing.rows = len(fetched)
+        logger.info(f"{len(fetched)} of {len(pairs)} indicators changed")
+        if len(fetched) == 0:
+            return
+        if stored is not None:
+            fetched["stored"] = stored.loc[~keys.isin(list(fetched))]
+        data = apply_schema(pd.concat(list(fetched.values()), ignore_index=True), MACRO_INDICATORS_SCHEMA)
+        data = data.sort_values(["country", "indicator", "date"], ignore_index=True)
+        self.to_parquet("macro_indicators", data[["country", "indicator", "date", "value"]])
+        for pair, content_hash in hashes.items():
+            manifest.start(job, pair)
+            manifest.done(job, pair, content_hash)
+
     def real_interest_rate(self, exchange: str, data: pd.DataFrame) -> None:
         self.to_parquet("real_interest_rate", data, exchange)
 
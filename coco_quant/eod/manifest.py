@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import threading
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class JobStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    UNCHANGED = "unchanged"
+    FAILED = "failed"
+
+
+class JobManifest:
+    # per-symbol state of the exchange sweeps, kept in a SQLite file so that a run can be resumed.
+    # A failed symbol is retried by the following runs until it has used up max_attempts attempts.
+    def __init__(self, path: str, max_attempts: int = 8):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            job TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            content_hash TEXT,
+            updated_at REAL,
+            PRIMARY KEY (job, symbol))""")
+
+    def __execute(self, sql: str, params: tuple = ()) -> list:
+        with self.__lock:
+            return self.__conn.execute(sql, params).fetchall()
+
+    def register(self, job: str, symbols: list) -> None:
+        # starts a new run over symbols, the content hashes of the previous runs are kept
+        with self.__lock:
+            self.__conn.execute("BEGIN")
+            try:
+                self.__register(job, symbols)
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+            self.__conn.execute("COMMIT")
+
+    def __register(self, job: str, symbols: list) -> None:
+        self.__conn.execute("CREATE TEMP TABLE IF NOT EXISTS listed (symbol TEXT PRIMARY KEY)")
+        self.__conn.execute("DELETE FROM listed")
+        self.__conn.executemany("INSERT OR IGNORE INTO listed VALUES (?)", [(symbol,) for symbol in symbols])
+        self.__conn.execute("DELETE FROM jobs WHERE job = ? AND symbol NOT IN (SELECT symbol FROM listed)", (job,))
+        self.__conn.execute("UPDATE jobs SET status = ?, attempts = 0, last_error = NULL WHERE job = ?", (JobStatus.PENDING, job))
+        self.__conn.execute("INSERT OR IGNORE INTO jobs (job, symbol, status, updated_at) SELECT ?, symbol, ?, ? FROM listed",
+                            (job, JobStatus.PENDING, time.time()))
+
+    def unfinished(self, job: str) -> list:
+        rows = self.__execute("""SELECT symbol FROM jobs WHERE job = ?
+                                 AND (status IN (?, ?) OR (status = ? AND attempts < ?)) ORDER BY symbol""",
+                              (job, JobStatus.PENDING, JobStatus.RUNNING, JobStatus.FAILED, self.max_attempts))
+        return [row[0] for row in rows]
+
+    def content_hash(self, job: str, symbol: str) -> str:
+        rows = self.__execute("SELECT content_hash FROM jobs WHERE job = ? AND symbol = ?", (job, symbol))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def start(self, job: str, symbol: str) -> None:
+        self.__execute("""INSERT INTO jobs (job, symbol, status, attempts, updated_at) VALUES (?, ?, ?, 1, ?)
+                          ON CONFLICT (job, symbol) DO UPDATE SET status = excluded.status, attempts = attempts + 1,
+                          updated_at = excluded.updated_at""", (job, symbol, JobStatus.RUNNING, time.time()))
+
+    def done(self, job: str, symbol: str, content_hash: str = None, status: str = JobStatus.DONE) -> None:
+        self.__execute("""UPDATE jobs SET status = ?, last_error = NULL, content_hash = COALESCE(?, content_hash), updated_at = ?
+                          WHERE job = ? AND symbol = ?""", (status, content_hash, time.time(), job, symbol))
+
+    def failed(self, job: str, symbol: str, error: str) -> None:
+        self.__execute("UPDATE jobs SET status = ?, last_error = ?, updated_at = ? WHERE job = ? AND symbol = ?",
+                       (JobStatus.FAILED, error, time.time(), job, symbol))
+
+    def summary(self, job: str) -> dict:
+        return dict(self.__execute("SELECT status, COUNT(*) FROM jobs WHERE job = ? GROUP BY status", (job,)))
+
+    def errors(self, job: str) -> list:
+        return self.__execute("SELECT symbol, attempts, last_error FROM jobs WHERE job = ? AND status = ? ORDER BY symbol",
+                              (job, JobStatus.FAILED))
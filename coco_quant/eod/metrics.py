@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from logging import getLogger
+from collections import namedtuple
+
+logger = getLogger(__name__)
+
+# one timed stage of a download: request, decode, parse or write. The endpoint is the first component of the API path,
+# e.g. eod or fundamentals, and the data set directory name for the writes
+Sample = namedtuple('Sample', ['endpoint', 'stage', 'seconds', 'bytes', 'rows', 'status'])
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Timing:
+    # set by the timed block, bytes, rows and status of the stage
+    def __init__(self):
+        self.bytes = 0
+        self.rows = 0
+        self.status = "ok"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.rows = 0
+        self.statuses = {}
+
+    def add(self, buckets: tuple, sample: Sample) -> None:
+        self.counts[bisect.bisect_left(buckets, sample.seconds)] += 1
+        self.count += 1
+        self.seconds += sample.seconds
+        self.bytes += sample.bytes
+        self.rows += sample.rows
+        self.statuses[str(sample.status)] = self.statuses.get(str(sample.status), 0) + 1
+
+
+class Metrics:
+    # per endpoint and stage timing histograms with byte, row and status counts, plus retries per endpoint.
+    # Every sample is also passed to the hooks, hook(sample), e.g. to forward it to a tracing system.
+    # Shared by the threads of a downloader; the worker processes send a snapshot back, see merge().
+    def __init__(self, buckets: tuple = BUCKETS, hooks: list = None):
+        self.buckets = tuple(buckets)
+        self.hooks = list(hooks) if hooks is not None else []
+        self.__lock = threading.Lock()
+        self.__histograms = {}
+        self.__retries = {}
+
+    def __reduce__(self) -> tuple:
+        return Metrics, (self.buckets, self.hooks)
+
+    def add_hook(self, hook) -> None:
+        self.hooks.append(hook)
+
+    def observe(self, endpoint: str, stage: str, seconds: float, bytes: int = 0, rows: int = 0, status="ok") -> None:
+        sample = Sample(endpoint, stage, seconds, bytes, rows, status)
+        with self.__lock:
+            histogram = self.__histograms.get((endpoint, stage))
+            if histogram is None:
+                histogram = self.__histograms[(endpoint, stage)] = Histogram(self.buckets)
+            histogram.add(self.buckets, sample)
+        for hook in self.hooks:
+            try:
+                hook(sample)
+            except Exception as ex:
+                logger.warning(f"metrics hook failed: {ex}")
+
+    @contextmanager
+    def timed(self, endpoint: str, stage: str):
+        # with metrics.timed("eod", "parse") as timing: ... timing.rows = len(data)
+        timing, start = Timing(), time.perf_counter()
+        try:
+            yield timing
+        except BaseException as ex:
+            timing.status = getattr(ex, "code", None) or type(ex).__name__
+            raise
+        finally:
+            self.observe(endpoint, stage, time.perf_counter() - start, timing.bytes, timing.rows, timing.status)
+
+    def retry(self, endpoint: str) -> None:
+        with self.__lock:
+            self.__retries[endpoint] = self.__retries.get(endpoint, 0) + 1
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__histograms, self.__retries = {}, {}
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            stages = [dict(endpoint=endpoint, stage=stage, count=h.count, seconds=h.seconds, bytes=h.bytes, rows=h.rows,
+                           buckets=list(h.counts), statuses=dict(h.statuses))
+                      for (endpoint, stage), h in sorted(self.__histograms.items())]
+            return dict(buckets=list(self.buckets), stages=stages, retries=dict(self.__retries))
+
+    def merge(self, snapshot: dict) -> None:
+        # adds a snapshot of another process, taken with the same buckets
+        with self.__lock:
+            for entry in snapshot["stages"]:
+                key = (entry["endpoint"], entry["stage"])
+                histogram = self.__histograms.get(key)
+                if histogram is None:
+                    histogram = self.__histograms[key] = Histogram(self.buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, entry["buckets"])]
+                histogram.count += entry["count"]
+                histogram.seconds += entry["seconds"]
+                histogram.bytes += entry["bytes"]
+                histogram.rows += entry["rows"]
+                for status, count in entry["statuses"].items():
+                    histogram.statuses[status] = histogram.statuses.get(status, 0) + count
+            for endpoint, count in snapshot["retries"].items():
+                self.__retries[endpoint] = self.__retries.get(endpoint, 0) + count
+
+    def to_json(self, indent: int = None) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix: str = "coco_quant") -> str:
+        # Prometheus text exposition format
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+        for entry in snapshot["stages"]:
+            labels = f'endpoint="{entry["endpoint"]}",stage="{entry["stage"]}"'
+            cumulative = 0
+            for le, count in zip([*map(str, self.buckets), "+Inf"], entry["buckets"]):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {entry['seconds']}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {entry['count']}")
+        for name in ["bytes", "rows"]:
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.extend(f'{prefix}_{name}_total{{endpoint="{entry["endpoint"]}",stage="{entry["stage"]}"}} {entry[name]}'
+                         for entry in snapshot["stages"])
+        lines.append(f"# TYPE {prefix}_stage_total counter")
+        lines.extend(f'{prefix}_stage_total{{endpoint="{entry["endpoint"]}",stage="{entry["stage"]}",status="{status}"}} {count}'
+                     for entry in snapshot["stages"] for status, count in sorted(entry["statuses"].items()))
+        lines.append(f"# TYPE {prefix}_retries_total counter")
+        lines.extend(f'{prefix}_retries_total{{endpoint="{endpoint}"}} {count}' for endpoint, count in sorted(snapshot["retries"].items()))
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        # one line per endpoint and stage, for the log
+        return "\n".join(f"{entry['endpoint']}:{entry['stage']}: count={entry['count']}, seconds={entry['seconds']:.3f}, "
+                         f"bytes={entry['bytes']}, rows={entry['rows']}, statuses={entry['statuses']}"
+                         for entry in self.snapshot()["stages"])
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import time
+import uuid
+import hashlib
+import threading
+import pandas as pd
+from contextlib import nullcontext
+from logging import getLogger
+from .metrics import Metrics, Timing
+
+logger = getLogger(__name__)
+
+ARTICLES = "articles"
+ARTICLE_SYMBOLS = "article_symbols"
+
+
+def article_id(link: str, title: str = None, date=None) -> str:
+    key = link if isinstance(link, str) and link else f"{title}|{date}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+class NewsStore:
+    # append-only news store. Every article is kept once in {news_dir}/articles, keyed by the hash of its link,
+    # and {news_dir}/article_symbols maps the symbols to the articles that mention them with the article date.
+    # New rows are buffered and written as one part file per table on flush(). Stores of concurrent processes
+    # may write the same article twice, the readers and compact() drop the duplicates.
+    def __init__(self, news_dir: str, compression: str = "zstd", flush_rows: int = 100000, catalog=None,
+                 metrics: Metrics = None):
+        self.news_dir = news_dir
+        self.compression = compression
+        self.flush_rows = flush_rows
+        self.catalog = catalog
+        self.metrics = metrics
+        self.__lock = threading.Lock()
+        # a flush returns once the rows buffered before it are on disk, also those taken by a concurrent flush
+        self.__flush_lock = threading.Lock()
+        self.__articles, self.__mappings = [], []
+        self.__buffered = 0
+        self.__ids = set()
+        self.__last_dates = {}
+        self.__load()
+
+    def __dir(self, table: str) -> str:
+        return f"{self.news_dir}/{table}"
+
+    def __dataset(self, table: str):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        files = sorted(glob.glob(f"{self.__dir(table)}/*.parquet"))
+        if len(files) == 0:
+            return None
+        # the part files may disagree on the columns, e.g. a batch in which every tag list is empty
+        schemas = [fragment.physical_schema for fragment in ds.dataset(files, format="parquet").get_fragments()]
+        return ds.dataset(files, schema=pa.unify_schemas(schemas, promote_options="permissive"), format="parquet")
+
+    def __read(self, table: str, columns: list = None, filter=None) -> pd.DataFrame:
+        dataset = self.__dataset(table)
+        return dataset.to_table(columns=columns, filter=filter).to_pandas() if dataset is not None else None
+
+    def __load(self) -> None:
+        articles = self.__read(ARTICLES, ["id"])
+        if articles is not None:
+            self.__ids = set(articles["id"])
+        mappings = self.__read(ARTICLE_SYMBOLS, ["symbol", "date"])
+        if mappings is not None and len(mappings) > 0:
+            self.__last_dates = mappings.groupby("symbol")["date"].max().to_dict()
+
+    def last_date(self, symbol: str) -> pd.Timestamp:
+        return self.__last_dates.get(symbol)
+
+    def add(self, symbol: str, data: pd.DataFrame) -> int:
+        # parsed news of a symbol, returns the number of items newer than the stored ones
+        if data is None or len(data) == 0:
+            return 0
+        data = data.assign(id=[article_id(link, title, date) for link, title, date in
+                               zip(data.get("link", [None] * len(data)), data.get("title", [None] * len(data)), data["date"])])
+        with self.__lock:
+            last = self.__last_dates.get(symbol)
+            if last is not None:
+                data = data.loc[data["date"] > last]
+            if len(data) == 0:
+                return 0
+            # a set lookup per row, isin converts the whole set of known ids on every call
+            articles = data.loc[[id_ not in self.__ids for id_ in data["id"]]].drop_duplicates("id")
+            self.__ids.update(articles["id"])
+            self.__articles.append(articles.drop(columns=["symbols"], errors="ignore"))
+            self.__mappings.append(data[["id", "date"]].assign(symbol=symbol)[["symbol", "id", "date"]])
+            self.__last_dates[symbol] = data["date"].max()
+            self.__buffered += len(data)
+            full = self.__buffered >= self.flush_rows
+        if full:
+            self.flush()
+        return len(data)
+
+    def __write(self, table: str, data: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.__dir(table), exist_ok=True)
+        path = f"{self.__dir(table)}/part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        with self.metrics.timed(table, "write") if self.metrics is not None else nullcontext(Timing()) as timing:
+            pq.write_table(pa.Table.from_pandas(data, preserve_index=False), f"{path}.tmp", compression=self.compression)
+            os.replace(f"{path}.tmp", path)
+            timing.rows = len(data)
+
+    def flush(self) -> None:
+        with self.__flush_lock:
+            self.__flush()
+
+    def __flush(self) -> None:
+        with self.__lock:
+            articles, mappings = self.__articles, self.__mappings
+            self.__articles, self.__mappings, self.__buffered = [], [], 0
+        if len(mappings) == 0:
+            return
+        if len(articles) > 0:
+            self.__write(ARTICLES, pd.concat(articles, ignore_index=True))
+        mappings = pd.concat(mappings, ignore_index=True)
+        self.__write(ARTICLE_SYMBOLS, mappings)
+        if self.catalog is not None:
+            for symbol, rows in mappings.groupby("symbol", sort=False):
+                self.catalog.record_frame(self.__dir(ARTICLE_SYMBOLS), symbol, rows, append=True)
+        logger.info(f"{self.news_dir}: {len(mappings)} new items, {sum(len(a) for a in articles)} new articles")
+
+    def articles(self, columns: list = None) -> pd.DataFrame:
+        data = self.__read(ARTICLES, None if columns is None else list(dict.fromkeys(["id"] + columns)))
+        return data.drop_duplicates("id", ignore_index=True) if data is not None else None
+
+    def symbol_articles(self, symbol: str, columns: list = None) -> pd.DataFrame:
+        # the articles mentioning the symbol, newest first
+        import pyarrow.dataset as ds
+
+        ids = self.__read(ARTICLE_SYMBOLS, ["id"], ds.field("symbol") == symbol)
+        articles = self.articles(columns)
+        if ids is None or articles is None:
+            return None
+        data = articles.loc[articles["id"].isin(ids["id"])]
+        return data.sort_values("date", ascending=False, ignore_index=True) if "date" in data.columns else data
+
+    def compact(self) -> None:
+        # merges the part files of each table into one and drops duplicated rows,
+        # must not run concurrently with writers of the store
+        for table, key in [(ARTICLES, ["id"]), (ARTICLE_SYMBOLS, ["symbol", "id"])]:
+            files = glob.glob(f"{self.__dir(table)}/*.parquet")
+            if len(files) < 2:
+                continue
+            data = self.__read(table).drop_duplicates(key, ignore_index=True)
+            self.__write(table, data)
+            for path in files:
+                os.remove(path)
+            logger.info(f"compacted {len(files)} files of {self.__dir(table)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
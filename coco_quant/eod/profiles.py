@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import pandas as pd
+from logging import getLogger
+from collections import namedtuple
+from .schema import TableSchema, CATEGORY, convert
+
+logger = getLogger(__name__)
+
+# how the tables are stored: the parquet codec, its level and the row group size, the stored dtypes of the columns
+# by data set directory name, and whether the numeric columns are downcast where no value changes
+StorageProfile = namedtuple('StorageProfile', ['name', 'compression', 'compression_level', 'row_group_size', 'schemas',
+                                               'downcast'])
+
+
+def stored(columns: dict) -> TableSchema:
+    # the columns not listed keep their dtype
+    return TableSchema(columns, None)
+
+
+FINANCIALS = [f"financials_{key}_{period}" for key in ["balance_sheet", "cash_flow", "income_statement"]
+              for period in ["quarterly", "yearly"]]
+
+# the repeated strings of every data set are dictionary-encoded
+ARCHIVE_SCHEMAS = {
+    "eod_prices": stored({"symbol": CATEGORY}),
+    "general": stored({"exchange": CATEGORY, "currencycode": CATEGORY}),
+    "earnings_history": stored({"currency": CATEGORY, "beforeaftermarket": CATEGORY}),
+    "earnings_trend": stored({"period": CATEGORY}),
+    **{name: stored({"currency_symbol": CATEGORY}) for name in FINANCIALS},
+    "economic_events": stored({"type": CATEGORY, "country": CATEGORY, "comparison": CATEGORY, "period": CATEGORY}),
+    "macro_indicators": stored({"country": CATEGORY, "indicator": CATEGORY}),
+}
+
+# only the tables holding many symbols or countries in one file are dictionary-encoded for reading: parquet encodes
+# the strings of a file by dictionary anyway, and merging the categories of many per-symbol files costs more than
+# decoding plain strings
+FAST_READ_SCHEMAS = {name: ARCHIVE_SCHEMAS[name] for name in ["economic_events", "macro_indicators"]}
+
+# lz4 decodes fastest, the smaller row groups let the reader skip more of a file by date
+FAST_READ = StorageProfile("fast-read", "lz4", None, 64 * 1024, FAST_READ_SCHEMAS, False)
+# zstd at a high level and the smallest lossless numeric types, for data read rarely
+ARCHIVE = StorageProfile("archive", "zstd", 9, 1024 * 1024, ARCHIVE_SCHEMAS, True)
+
+PROFILES = {profile.name: profile for profile in [FAST_READ, ARCHIVE]}
+
+
+def storage_profile(name) -> StorageProfile:
+    # a profile or its name, None keeps the defaults of pandas
+    return PROFILES[name] if isinstance(name, str) else name
+
+
+def downcast(data: pd.Series) -> pd.Series:
+    # the smallest numeric type holding every value unchanged
+    if data.dtype == np.float64:
+        narrow = data.astype(np.float32)
+        return narrow if ((narrow.astype(np.float64) == data) | data.isna()).all() else data
+    if data.dtype == np.int64:
+        return pd.to_numeric(data, downcast="integer")
+    if isinstance(data.dtype, pd.Int64Dtype) and data.notna().any():
+        if np.iinfo(np.int32).min <= data.min() and data.max() <= np.iinfo(np.int32).max:
+            return data.astype("Int32")
+    return data
+
+
+def apply_profile(profile: StorageProfile, dataset_dir: str, data: pd.DataFrame) -> pd.DataFrame:
+    if profile is None or data is None:
+        return data
+    schema = profile.schemas.get(os.path.basename(os.path.normpath(dataset_dir)))
+    if schema is None and not profile.downcast:
+        return data
+    columns = {}
+    for column in data.columns:
+        dtype = schema.columns.get(column, schema.default) if schema is not None else None
+        values = convert(data[column], dtype) if dtype is not None else data[column]
+        columns[column] = downcast(values) if profile.downcast else values
+    return pd.DataFrame(columns, index=data.index)
+
+
+def parquet_options(profile: StorageProfile) -> dict:
+    # the arguments of pyarrow.parquet.write_table
+    if profile is None:
+        return {}
+    options = dict(compression=profile.compression, row_group_size=profile.row_group_size)
+    if profile.compression_level is not None:
+        options["compression_level"] = profile.compression_level
+    return options
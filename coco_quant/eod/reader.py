@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import pandas as pd
+from logging import getLogger
+from .executor import run_concurrently
+from .storage import ParquetFileStorage, PartitionedStorage, NULL_PARTITION
+from .catalog import Catalog, date_range
+from .adjustments import adjust_prices
+
+logger = getLogger(__name__)
+
+
+def bound(value, type_):
+    # a date bound as an arrow scalar of the type of the date column
+    import pyarrow as pa
+
+    value = pd.Timestamp(value)
+    if pa.types.is_timestamp(type_):
+        if type_.tz is not None:
+            value = value.tz_localize(type_.tz) if value.tzinfo is None else value.tz_convert(type_.tz)
+        elif value.tzinfo is not None:
+            value = value.tz_convert(None)
+        return pa.scalar(value.to_pydatetime(), type=type_)
+    if pa.types.is_date(type_):
+        return pa.scalar(value.date(), type=type_)
+    return pa.scalar(str(value.date()))
+
+
+class EodDataReader:
+    # the read side of EodDataDownloader: long frames and wide panels over a data set for a list of symbols,
+    # a date range and a subset of the columns. Only the needed columns and row groups are read, the files
+    # of a one-file-per-symbol store are read by max_workers threads and memory-mapped. With a catalog the symbols
+    # and date ranges are looked up in the index instead of listing and opening the files.
+    def __init__(self, base_dir: str, storage=None, max_workers: int = 8, date_column: str = "date",
+                 memory_map: bool = True, catalog: Catalog = None):
+        self.base_dir = base_dir
+        self.catalog = catalog
+        self.storage = storage if storage is not None else ParquetFileStorage()
+        self.max_workers = max_workers
+        self.date_column = date_column
+        self.memory_map = memory_map
+
+    def __dataset_dir(self, dataset: str) -> str:
+        return f"{self.base_dir}/{dataset}"
+
+    def symbols(self, dataset: str = "eod_prices") -> list:
+        if self.catalog is not None:
+            return self.catalog.symbols(dataset)
+        dataset_dir = self.__dataset_dir(dataset)
+        if isinstance(self.storage, PartitionedStorage):
+            table = self.storage.query_table(dataset_dir, columns=["symbol"])
+            return sorted(set(table.column("symbol").to_pylist())) if table is not None else []
+        return sorted(os.path.basename(path)[:-len(".parq")] for path in glob.glob(f"{dataset_dir}/*.parq"))
+
+    def __date_filter(self, type_, start, end):
+        import pyarrow.dataset as ds
+
+        field, expression = ds.field(self.date_column), None
+        if start is not None:
+            expression = field >= bound(start, type_)
+        if end is not None:
+            expression = field <= bound(end, type_) if expression is None else expression & (field <= bound(end, type_))
+        return expression
+
+    def __read_file(self, dataset_dir: str, symbol: str, start, end, columns: list):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = self.storage.path(dataset_dir, symbol)
+        if not os.path.exists(path):
+            return None
+        parquet = pq.ParquetFile(path, memory_map=self.memory_map)
+        schema = parquet.schema_arrow
+        names = schema.names if columns is None else [name for name in columns if name in schema.names]
+        filtered = (start is not None or end is not None) and self.date_column in schema.names
+        groups = list(range(parquet.num_row_groups))
+        if filtered:
+            type_ = schema.field(self.date_column).type
+            low = bound(start, type_).as_py() if start is not None else None
+            high = bound(end, type_).as_py() if end is not None else None
+            groups = [group for group in groups if self.__overlaps(parquet, group, low, high)]
+            names = list(dict.fromkeys(names + [self.date_column]))
+        table = parquet.read_row_groups(groups, columns=names, use_threads=False)
+        if filtered:
+            table = table.filter(self.__date_filter(schema.field(self.date_column).type, start, end))
+            if columns is not None and self.date_column not in columns:
+                table = table.drop_columns([self.date_column])
+        if "symbol" not in table.column_names:
+            table = table.append_column("symbol", pa.array([symbol] * table.num_rows, pa.string()))
+        return table
+
+    def __overlaps(self, parquet, group: int, low, high) -> bool:
+        # row group pruning by the min/max statistics of the date column
+        metadata = parquet.metadata.row_group(group)
+        index = parquet.schema_arrow.get_field_index(self.date_column)
+        statistics = metadata.column(index).statistics
+        if statistics is None or not statistics.has_min_max:
+            return True
+        try:
+            return (low is None or statistics.max >= low) and (high is None or statistics.min <= high)
+        except TypeError:
+            return True
+
+    def __in_range(self, dataset: str, symbol: str, start, end) -> bool:
+        # False when the catalog knows that the symbol has no rows in the range
+        entry = self.catalog.entry(dataset, symbol)
+        if entry is None or entry.min_date is None:
+            return True
+        start = date_range([start])[0] if start is not None else None
+        end = date_range([end])[0] if end is not None else None
+        return (start is None or entry.max_date >= start) and (end is None or entry.min_date <= end)
+
+    def __read_partitioned(self, dataset_dir: str, symbols: list, start, end, columns: list):
+        import pyarrow.dataset as ds
+
+        dataset = self.storage.dataset(dataset_dir)
+        if dataset is None:
+            return None
+        expression = None
+        if symbols is not None:
+            exchanges = {PartitionedStorage.exchange(symbol) for symbol in symbols}
+            field = ds.field("exchange_code")
+            partitions = field.isin([exchange for exchange in exchanges if exchange != NULL_PARTITION])
+            partitions = partitions | field.is_null() if NULL_PARTITION in exchanges else partitions
+            expression = partitions & ds.field("symbol").isin(symbols)
+        if self.date_column in dataset.schema.names and (start is not None or end is not None):
+            dates = self.__date_filter(dataset.schema.field(self.date_column).type, start, end)
+            expression = dates if expression is None else expression & dates
+        table = self.storage.query_table(dataset_dir, expression, columns)
+        if table is None or table.num_rows == 0:
+            return None
+        return table.select([name for name in table.column_names if name not in ["exchange_code", "year"]
+                             or (columns is not None and name in columns)])
+
+    def read_table(self, dataset: str = "eod_prices", symbols: list = None, start=None, end=None, columns: list = None):
+        # long arrow table with a symbol column, None when nothing is stored
+        import pyarrow as pa
+
+        dataset_dir = self.__dataset_dir(dataset)
+        if isinstance(self.storage, PartitionedStorage):
+            return self.__read_partitioned(dataset_dir, symbols, start, end, columns)
+        symbols = self.symbols(dataset) if symbols is None else symbols
+        if self.catalog is not None and (start is not None or end is not None):
+            symbols = [symbol for symbol in symbols if self.__in_range(dataset, symbol, start, end)]
+        tables = run_concurrently(lambda symbol: self.__read_file(dataset_dir, symbol, start, end, columns),
+                                  symbols, self.max_workers)
+        tables = [table for table in tables if table is not None]
+        if len(tables) == 0:
+            return None
+        return pa.concat_tables(tables, promote_options="permissive")
+
+    def read(self, dataset: str = "eod_prices", symbols: list = None, start=None, end=None,
+             columns: list = None) -> pd.DataFrame:
+        table = self.read_table(dataset, symbols, start, end, columns)
+        return table.to_pandas() if table is not None else None
+
+    def adjusted_prices(self, symbols: list = None, start=None, end=None, columns: list = None) -> pd.DataFrame:
+        # the eod bars adjusted for the splits and dividends after them by the factors in adjustment_factors,
+        # the volume as float
+        if columns is not None:
+            columns = list(dict.fromkeys(list(columns) + [self.date_column]))
+        data = self.read("eod_prices", symbols, start, end, columns)
+        if data is None:
+            return None
+        # every factor after start matters, the ones after end included
+        factors = self.read("adjustment_factors", sorted(set(data["symbol"])),
+                            columns=["symbol", self.date_column, "price_factor", "volume_factor"])
+        return adjust_prices(data, factors)
+
+    def panel(self, column: str = "close", symbols: list = None, start=None, end=None,
+              dataset: str = "eod_prices", adjusted: bool = False) -> pd.DataFrame:
+        # wide frame, date x symbol, of the split and dividend adjusted eod bars with adjusted
+        if adjusted:
+            data = self.adjusted_prices(symbols, start, end, [self.date_column, column])
+        else:
+            data = self.read(dataset, symbols, start, end, [self.date_column, column])
+        if data is None:
+            return None
+        data = data.drop_duplicates([self.date_column, "symbol"], keep="last")
+        panel = data.pivot(index=self.date_column, columns="symbol", values=column).sort_index()
+        panel.columns.name = None
+        return panel[[symbol for symbol in symbols if symbol in panel.columns]] if symbols is not None else panel
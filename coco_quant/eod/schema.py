@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+from collections import namedtuple
+
+DATETIME = "datetime64[ns]"
+FLOAT = "float64"
+STRING = "object"
+# dictionary-encoded strings
+CATEGORY = "category"
+
+# columns maps a column name to its dtype, default applies to the columns not listed
+TableSchema = namedtuple('TableSchema', ['columns', 'default'])
+
+
+def convert(data: pd.Series, dtype: str) -> pd.Series:
+    if dtype.startswith("datetime64"):
+        return pd.to_datetime(data, errors="coerce", utc="UTC" in dtype)
+    if dtype == STRING:
+        return data
+    if dtype == CATEGORY:
+        return data.astype(CATEGORY)
+    return pd.to_numeric(data, errors="coerce").astype(dtype)
+
+
+def pandas_dtypes(schema: TableSchema, names: list) -> dict:
+    if schema is None:
+        return {}
+    return {name: schema.columns.get(name, schema.default) for name in names}
+
+
+def arrow_type(dtype: str):
+    import pyarrow as pa
+
+    if dtype.startswith("datetime64"):
+        return pa.timestamp("ns", tz="UTC" if "UTC" in dtype else None)
+    if dtype == STRING:
+        return pa.string()
+    if dtype == CATEGORY:
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.from_numpy_dtype(dtype.lower())
+
+
+def arrow_types(schema: TableSchema, names: list) -> dict:
+    return {name: arrow_type(dtype) for name, dtype in pandas_dtypes(schema, names).items()}
+
+
+def apply_schema(data: pd.DataFrame, schema: TableSchema) -> pd.DataFrame:
+    if data is None or schema is None:
+        return data
+    columns = {column: convert(data[column], schema.columns.get(column, schema.default)) for column in data.columns}
+    return pd.DataFrame(columns, index=data.index)
+
+
+EOD_PRICES_SCHEMA = TableSchema({
+    'date': DATETIME,
+    'open': FLOAT,
+    'high': FLOAT,
+    'low': FLOAT,
+    'close': FLOAT,
+    'adjusted_close': FLOAT,
+    'volume': "Int64",
+}, STRING)
+
+EOD_BULK_SCHEMA = TableSchema(dict(EOD_PRICES_SCHEMA.columns, code=STRING, ex=STRING,
+                                   prev_close=FLOAT, change=FLOAT, change_p=FLOAT), STRING)
+
+# split is the ratio as the API writes it, e.g. 4.000000/1.000000, ratio the new shares per old share
+SPLITS_SCHEMA = TableSchema({
+    'date': DATETIME,
+    'split': STRING,
+    'ratio': FLOAT,
+}, STRING)
+
+# value is adjusted for the later splits, unadjustedvalue is the cash paid per share at the time
+DIVIDENDS_SCHEMA = TableSchema({
+    'date': DATETIME,
+    'declarationdate': DATETIME,
+    'recorddate': DATETIME,
+    'paymentdate': DATETIME,
+    'value': FLOAT,
+    'unadjustedvalue': FLOAT,
+}, STRING)
+
+EARNINGS_SCHEMA = TableSchema({
+    'date': DATETIME,
+    'reportdate': DATETIME,
+    'period': STRING,
+    'currency': STRING,
+    'beforeaftermarket': STRING,
+}, FLOAT)
+
+FINANCIALS_SCHEMA = TableSchema({
+    'date': DATETIME,
+    'filing_date': DATETIME,
+    'currency_symbol': STRING,
+}, FLOAT)
+
+SENTIMENTS_SCHEMA = TableSchema({
+    'date': "datetime64[ns, UTC]",
+    'polarity': FLOAT,
+    'neg': FLOAT,
+    'neu': FLOAT,
+    'pos': FLOAT,
+}, STRING)
+
+MACRO_INDICATORS_SCHEMA = TableSchema({
+    'country': STRING,
+    'indicator': STRING,
+    'date': DATETIME,
+    'value': FLOAT,
+}, STRING)
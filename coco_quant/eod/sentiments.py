@@ -1,33 +1,30 @@
 # -*- coding: utf-8 -*-
 
-import json
 import pandas as pd
 from logging import getLogger
 from .eod_prices import EodData
+from .schema import apply_schema, SENTIMENTS_SCHEMA
 
 logger = getLogger(__name__)
 
 
 class SentimentsData(EodData):
-    def __init__(self, base_dir: str, api_token: str):
-        super().__init__(f"{base_dir}/sentiments", api_token, ['parse_sentiment'])
+    def __init__(self, base_dir: str, api_token: str, **kwargs):
+        super().__init__(f"{base_dir}/sentiments", api_token, ['parse_sentiments', 'sentiments_exchange'], **kwargs)
 
     @staticmethod
     def parse_sentiments(data: pd.DataFrame) -> pd.DataFrame:
-        sentiment = None
-        for i in range(len(data.sentiment)):
-            tmp = pd.DataFrame.from_dict([data.sentiment.iloc[i]])
-            sentiment = pd.concat([sentiment, tmp], ignore_index=True) if sentiment is not None else tmp
-        data.drop('sentiment', axis=1, inplace=True)
-        data['date'] = pd.to_datetime(data['date'])
-        return pd.concat([data, sentiment], axis=1)
+        records = [value if isinstance(value, dict) else {} for value in data.get('sentiment', [None] * len(data))]
+        sentiment = pd.DataFrame.from_records(records, index=data.index, columns=['polarity', 'neg', 'neu', 'pos'])
+        data = pd.concat([data.drop(columns='sentiment', errors='ignore'), sentiment], axis=1)
+        return apply_schema(data, SENTIMENTS_SCHEMA)
 
     def sentiments(self, symbol: str) -> None:
-        data = self.request("news", [f"s={symbol}"])
-        data = json.loads(data)
-        data = pd.DataFrame.from_dict(data)
-        data = SentimentsData.parse_sentiments(data)
+        data = self.request_json("news", [f"s={symbol}"])
+        with self.timed("news", "parse") as timing:
+            data = SentimentsData.parse_sentiments(pd.DataFrame.from_dict(data))
+            timing.rows = len(data)
         self.to_parquet(symbol, data)
 
-    def sentiments_country(self, exchange: str) -> None:
-        self.bulk_request(exchange, self.sentiments)
+    def sentiments_exchange(self, exchange: str, shard: list = None) -> dict:
+        return self.bulk_request(exchange, self.sentiments, shard=shard)
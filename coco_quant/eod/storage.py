@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import time
+import uuid
+import threading
+import pandas as pd
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+GENERATION = "_generation"
+PARTITION_COLUMNS = ["exchange_code", "year"]
+
+
+class ParquetFileStorage:
+    # one parquet file per symbol: {dataset_dir}/{symbol}.parq
+    def path(self, dataset_dir: str, symbol: str) -> str:
+        return f"{dataset_dir}/{symbol}.parq"
+
+    def write(self, dataset_dir: str, symbol: str, data: pd.DataFrame, options: dict = None) -> None:
+        # options are passed to pyarrow.parquet.write_table, e.g. compression and row_group_size
+        os.makedirs(dataset_dir, exist_ok=True)
+        data.to_parquet(self.path(dataset_dir, symbol), **(options or {}))
+
+    def write_many(self, dataset_dir: str, frames: dict, options: dict = None) -> None:
+        # frames by symbol
+        os.makedirs(dataset_dir, exist_ok=True)
+        for symbol, data in frames.items():
+            data.to_parquet(self.path(dataset_dir, symbol), **(options or {}))
+
+    def write_batches(self, dataset_dir: str, symbol: str, batches) -> None:
+        # writes arrow record batches as row groups while they arrive
+        import pyarrow.parquet as pq
+
+        os.makedirs(dataset_dir, exist_ok=True)
+        path, writer = self.path(dataset_dir, symbol), None
+        try:
+            for batch in batches:
+                if writer is None:
+                    writer = pq.ParquetWriter(f"{path}.tmp", batch.schema)
+                writer.write_batch(batch)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+                os.remove(f"{path}.tmp")
+            raise
+        if writer is not None:
+            writer.close()
+            os.replace(f"{path}.tmp", path)
+
+    def exists(self, dataset_dir: str, symbol: str) -> bool:
+        return os.path.exists(self.path(dataset_dir, symbol))
+
+    def delete(self, dataset_dir: str, symbol: str) -> None:
+        if os.path.exists(self.path(dataset_dir, symbol)):
+            os.remove(self.path(dataset_dir, symbol))
+
+    def read(self, dataset_dir: str, symbol: str, columns: list = None) -> pd.DataFrame:
+        if not os.path.exists(self.path(dataset_dir, symbol)):
+            return None
+        return pd.read_parquet(self.path(dataset_dir, symbol), columns=columns)
+
+    def append(self, dataset_dir: str, symbol: str, data: pd.DataFrame, options: dict = None) -> None:
+        stored = self.read(dataset_dir, symbol)
+        if stored is not None:
+            data = pd.concat([stored, data[[column for column in stored.columns if column in data.columns]]], ignore_index=True)
+            # the concatenation of categoricals with different categories is an object column
+            categories = [column for column in stored.columns if isinstance(stored[column].dtype, pd.CategoricalDtype)]
+            data = data.astype({column: "category" for column in categories})
+        self.write(dataset_dir, symbol, data, options)
+
+
+class PartitionedStorage:
+    # hive-partitioned dataset per table: {dataset_dir}/exchange_code=US/year=2022/part-*.parquet,
+    # the symbol is a column. A write replaces the symbol's rows by starting a new generation,
+    # readers keep the latest generation of every symbol and compact() drops the superseded rows.
+    def __init__(self, row_group_size: int = 128 * 1024, compression: str = "zstd", date_column: str = "date",
+                 compact_min_files: int = 8):
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.date_column = date_column
+        self.compact_min_files = compact_min_files
+        # the schemas of the part files, which are never modified, and the latest generation of every symbol by
+        # dataset, so that an append does not read the whole dataset again. The generations are loaded once per
+        # dataset, the writes of other processes to the same symbols are not seen.
+        self.__schemas = {}
+        self.__generations = {}
+        self.__lock = threading.Lock()
+
+    def __reduce__(self) -> tuple:
+        # a worker process starts with empty schema and generation caches
+        return PartitionedStorage, (self.row_group_size, self.compression, self.date_column, self.compact_min_files)
+
+    @staticmethod
+    def exchange(symbol: str) -> str:
+        return symbol.rsplit(".", 1)[1] if "." in symbol else NULL_PARTITION
+
+    def __partitions(self, data: pd.DataFrame) -> dict:
+        # the rows may belong to several symbols
+        exchanges = data["symbol"].map(PartitionedStorage.exchange).rename("exchange_code")
+        if self.date_column not in data.columns:
+            return {f"exchange_code={exchange}": part for exchange, part in data.groupby(exchanges, sort=False)}
+        years = pd.to_datetime(data[self.date_column], errors="coerce", utc=True).dt.year.rename("year")
+        return {f"exchange_code={exchange}/year={NULL_PARTITION if pd.isna(year) else int(year)}": part
+                for (exchange, year), part in data.groupby([exchanges, years], dropna=False, sort=False)}
+
+    def __write_file(self, directory: str, data: pd.DataFrame, tag: str = "", options: dict = None) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        path = f"{directory}/part-{time.time_ns()}-{uuid.uuid4().hex[:8]}{tag}.parquet"
+        options = dict(dict(row_group_size=self.row_group_size, compression=self.compression), **(options or {}))
+        pq.write_table(table, f"{path}.tmp", write_statistics=True, **options)
+        os.replace(f"{path}.tmp", path)
+
+    def __put(self, dataset_dir: str, symbol: str, data: pd.DataFrame, generation: int, options: dict = None) -> None:
+        data = data.assign(symbol=symbol, **{GENERATION: generation})
+        for partition, part in self.__partitions(data).items():
+            self.__write_file(f"{dataset_dir}/{partition}", part, options=options)
+        self.__written(dataset_dir, [symbol], generation)
+
+    def __written(self, dataset_dir: str, symbols: list, generation: int) -> None:
+        with self.__lock:
+            generations = self.__generations.get(os.path.normpath(dataset_dir))
+            if generations is not None:
+                generations.update(dict.fromkeys(symbols, generation))
+
+    def __file_schema(self, files: list):
+        # symbols may disagree on the columns of a table, e.g. financial statements
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schemas = []
+        for path in files:
+            schema = self.__schemas.get(path)
+            if schema is None:
+                schema = self.__schemas[path] = pq.read_schema(path)
+            schemas.append(schema)
+        return pa.unify_schemas(schemas, promote_options="permissive")
+
+    def dataset(self, dataset_dir: str):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        files = glob.glob(f"{dataset_dir}/**/*.parquet", recursive=True)
+        if len(files) == 0:
+            return None
+        # the partition types are fixed, they cannot be inferred when every exchange_code is null
+        partitioning = ds.partitioning(pa.schema([("exchange_code", pa.string()), ("year", pa.int32())]), flavor="hive")
+        schema = pa.unify_schemas([self.__file_schema(files), partitioning.schema], promote_options="permissive")
+        return ds.dataset(files, schema=schema, format="parquet", partitioning=partitioning, partition_base_dir=dataset_dir)
+
+    @staticmethod
+    def latest(table):
+        # the arrow table restricted to the latest generation of every symbol
+        import pyarrow as pa
+
+        if GENERATION not in table.column_names:
+            return table
+        generations = table.select(["symbol", GENERATION]).to_pandas()
+        latest = generations.groupby("symbol")[GENERATION].transform("max")
+        table = table.filter(pa.array((generations[GENERATION] == latest).to_numpy()))
+        return table.select([name for name in table.column_names if name != GENERATION])
+
+    def query_table(self, dataset_dir: str, filter=None, columns: list = None):
+        dataset = self.dataset(dataset_dir)
+        if dataset is None:
+            return None
+        if columns is not None:
+            columns = list(dict.fromkeys(list(columns) + ["symbol", GENERATION]))
+        return PartitionedStorage.latest(dataset.to_table(columns=columns, filter=filter))
+
+    def query(self, dataset_dir: str, filter=None, columns: list = None) -> pd.DataFrame:
+        table = self.query_table(dataset_dir, filter, columns)
+        return table.to_pandas() if table is not None else None
+
+    def __symbol_filter(self, symbol: str):
+        import pyarrow.dataset as ds
+
+        exchange = PartitionedStorage.exchange(symbol)
+        field = ds.field("exchange_code")
+        return (field.is_null() if exchange == NULL_PARTITION else field == exchange) & (ds.field("symbol") == symbol)
+
+    def __latest_generations(self, dataset_dir: str) -> dict:
+        dataset = self.dataset(dataset_dir) if os.path.isdir(dataset_dir) else None
+        if dataset is None:
+            return {}
+        generations = dataset.to_table(columns=["symbol", GENERATION]).to_pandas()
+        return generations.groupby("symbol")[GENERATION].max().to_dict()
+
+    def __generation(self, dataset_dir: str, symbol: str) -> int:
+        with self.__lock:
+            key = os.path.normpath(dataset_dir)
+            if key not in self.__generations:
+                self.__generations[key] = self.__latest_generations(dataset_dir)
+            return self.__generations[key].get(symbol)
+
+    def exists(self, dataset_dir: str, symbol: str) -> bool:
+        return self.__generation(dataset_dir, symbol) is not None
+
+    def write(self, dataset_dir: str, symbol: str, data: pd.DataFrame, options: dict = None) -> None:
+        self.__put(dataset_dir, symbol, data, time.time_ns(), options)
+
+    def write_many(self, dataset_dir: str, frames: dict, options: dict = None) -> None:
+        # frames by symbol, written as one file per partition instead of one per symbol
+        import pyarrow as pa
+
+        if len(frames) == 0:
+            return
+        generation = time.time_ns()
+        data = pd.concat([data.assign(symbol=symbol, **{GENERATION: generation}) for symbol, data in frames.items()],
+                         ignore_index=True)
+        for partition, part in self.__partitions(data).items():
+            try:
+                self.__write_file(f"{dataset_dir}/{partition}", part, options=options)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # the symbols disagree on the type of a column, they are written one by one
+                for _, rows in part.groupby("symbol", sort=False):
+                    self.__write_file(f"{dataset_dir}/{partition}", rows, options=options)
+        self.__written(dataset_dir, list(frames), generation)
+
+    def write_batches(self, dataset_dir: str, symbol: str, batches) -> None:
+        generation = time.time_ns()
+        for batch in batches:
+            self.__put(dataset_dir, symbol, batch.to_pandas(), generation)
+
+    def append(self, dataset_dir: str, symbol: str, data: pd.DataFrame, options: dict = None) -> None:
+        generation = self.__generation(dataset_dir, symbol)
+        self.__put(dataset_dir, symbol, data, generation if generation is not None else time.time_ns(), options)
+
+    def read(self, dataset_dir: str, symbol: str, columns: list = None) -> pd.DataFrame:
+        if not os.path.isdir(dataset_dir):
+            return None
+        data = self.query(dataset_dir, self.__symbol_filter(symbol), columns)
+        if data is None or len(data) == 0:
+            return None
+        if self.date_column in data.columns:
+            data = data.sort_values(self.date_column, ignore_index=True)
+        return data[columns] if columns is not None else data.drop(columns=PARTITION_COLUMNS, errors="ignore")
+
+    def delete(self, dataset_dir: str, symbol: str) -> None:
+        # rewrites the part files of the symbol's exchange without its rows,
+        # must not run concurrently with writers of the same dataset
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        exchange = PartitionedStorage.exchange(symbol)
+        for path in glob.glob(f"{dataset_dir}/exchange_code={exchange}/**/*.parquet", recursive=True):
+            table = pq.ParquetFile(path).read()
+            kept = table.filter(pc.not_equal(table.column("symbol"), symbol))
+            if kept.num_rows == table.num_rows:
+                continue
+            if kept.num_rows == 0:
+                os.remove(path)
+                self.__schemas.pop(path, None)
+                continue
+            pq.write_table(kept, f"{path}.tmp", row_group_size=self.row_group_size, compression=self.compression,
+                           write_statistics=True)
+            os.replace(f"{path}.tmp", path)
+        with self.__lock:
+            self.__generations.get(os.path.normpath(dataset_dir), {}).pop(symbol, None)
+
+    def compact(self, dataset_dir: str) -> None:
+        # merges the files of every partition with at least compact_min_files files into one,
+        # must not run concurrently with writers of the same dataset
+        import pyarrow.dataset as ds
+
+        latest = pd.Series(self.__latest_generations(dataset_dir), dtype="int64")
+        if len(latest) == 0:
+            return
+        directories = {}
+        for path in glob.glob(f"{dataset_dir}/**/*.parquet", recursive=True):
+            directories.setdefault(os.path.dirname(path), []).append(path)
+        for directory, files in directories.items():
+            if len(files) < self.compact_min_files:
+                continue
+            # the partition values are in the directory names, they are not columns of the files
+            data = ds.dataset(files, schema=self.__file_schema(files), format="parquet").to_table().to_pandas()
+            data = data.loc[data[GENERATION] == data["symbol"].map(latest)]
+            sort_by = [column for column in ["symbol", self.date_column] if column in data.columns]
+            self.__write_file(directory, data.sort_values(sort_by).reset_index(drop=True), "-compacted")
+            for path in files:
+                os.remove(path)
+                self.__schemas.pop(path, None)
+            logger.info(f"compacted {len(files)} files in {directory}")
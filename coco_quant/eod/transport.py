@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import ssl
+import zlib
+import gzip
+import queue
+import threading
+import http.client
+import urllib.request as req
+from logging import getLogger
+from urllib.error import HTTPError
+from urllib.parse import urlsplit, urljoin, parse_qsl, quote
+from contextlib import contextmanager
+
+logger = getLogger(__name__)
+
+EOD_HISTORICAL_DATA_URL = "https://eodhistoricaldata.com/api"
+DEFAULT_TIMEOUT = 30.0
+CHUNK_SIZE = 1024 * 1024
+
+
+def decode_content(body: bytes, encoding: str) -> bytes:
+    encoding = (encoding or "").strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return gzip.decompress(body)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # some servers send a raw deflate stream without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class ContentDecoder(io.RawIOBase):
+    # incremental gzip/deflate decoding of a response stream
+    def __init__(self, raw, encoding: str):
+        self.raw = raw
+        encoding = encoding.strip().lower()
+        self.__raw_deflate = encoding == "deflate"
+        self.__decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding in ("gzip", "x-gzip") else zlib.MAX_WBITS)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.__decompressor.eof:
+            data = self.__decompressor.unconsumed_tail or self.raw.read(CHUNK_SIZE)
+            if not data:
+                break
+            try:
+                out = self.__decompressor.decompress(data, len(buffer))
+            except zlib.error:
+                if not self.__raw_deflate:
+                    raise
+                # some servers send a raw deflate stream without the zlib header
+                self.__raw_deflate = False
+                self.__decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                out = self.__decompressor.decompress(data, len(buffer))
+            self.__raw_deflate = False
+            if len(out) > 0:
+                buffer[:len(out)] = out
+                return len(out)
+        return 0
+
+
+class Transport:
+    def get(self, url: str) -> bytes:
+        raise NotImplementedError
+
+    def received(self, data: bytes) -> int:
+        # bytes on the wire of the response whose decoded body get() last returned to this thread
+        return len(data)
+
+    @contextmanager
+    def stream(self, url: str):
+        # binary file-like over the decoded response body
+        yield io.BytesIO(self.get(url))
+
+    def close(self) -> None:
+        pass
+
+
+def fixture_name(url: str) -> str:
+    # file name of a recorded response: the API path and the sorted parameters without the token,
+    # e.g. eod/AAPL.US?from=2022-01-03 quoted into one path component
+    parts = urlsplit(url)
+    path = parts.path.split("/api/", 1)[-1].strip("/")
+    params = sorted((key, value) for key, value in parse_qsl(parts.query) if key != "api_token")
+    return quote(path + ("?" + "&".join(f"{key}={value}" for key, value in params) if len(params) > 0 else ""), safe="")
+
+
+class RecordingTransport(Transport):
+    # saves every response body of the wrapped transport as <fixtures_dir>/<fixture_name>, so that a run against
+    # the API can be replayed offline, e.g. by benchmarks/mock_server.py
+    def __init__(self, transport: Transport, fixtures_dir: str):
+        self.transport = transport
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def get(self, url: str) -> bytes:
+        data = self.transport.get(url)
+        path = f"{self.fixtures_dir}/{fixture_name(url)}"
+        tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return data
+
+    def received(self, data: bytes) -> int:
+        return self.transport.received(data)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class UrllibTransport(Transport):
+    # one connection per request, the behavior before the pooled transport was introduced
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, context: ssl.SSLContext = None):
+        self.timeout = timeout
+        self.context = context
+
+    def get(self, url: str) -> bytes:
+        with req.urlopen(url, timeout=self.timeout, context=self.context) as ret:
+            return ret.read()
+
+    @contextmanager
+    def stream(self, url: str):
+        with req.urlopen(url, timeout=self.timeout, context=self.context) as ret:
+            yield ret
+
+
+class PooledTransport(Transport):
+    MAX_REDIRECTS = 5
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_connections: int = 32, context: ssl.SSLContext = None):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        # the default context loads the CA certificates, it is created with the first https connection
+        self.__context, self.__given_context = context, context
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__pools = {}
+        self.__headers = {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+
+    def __reduce__(self) -> tuple:
+        # a worker process opens its own connections
+        return PooledTransport, (self.timeout, self.max_connections, self.__given_context)
+
+    @property
+    def context(self) -> ssl.SSLContext:
+        with self.__lock:
+            if self.__context is None:
+                self.__context = ssl.create_default_context()
+            return self.__context
+
+    def __pool(self, scheme: str, netloc: str) -> queue.LifoQueue:
+        # dict.setdefault is atomic, so concurrent callers end up sharing one pool
+        return self.__pools.setdefault((scheme, netloc), queue.LifoQueue(self.max_connections))
+
+    def __connect(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout, context=self.context)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def __checkout(self, scheme: str, netloc: str) -> tuple:
+        try:
+            return self.__pool(scheme, netloc).get_nowait(), True
+        except queue.Empty:
+            return self.__connect(scheme, netloc), False
+
+    def __release(self, parts, conn: http.client.HTTPConnection, ret: http.client.HTTPResponse) -> None:
+        # a connection goes back to the pool only once its response has been read completely
+        if not ret.isclosed() or ret.will_close:
+            conn.close()
+            return
+        try:
+            self.__pool(parts.scheme, parts.netloc).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def __open(self, parts) -> tuple:
+        target = f"{parts.path or '/'}?{parts.query}" if parts.query else parts.path or "/"
+        conn, reused = self.__checkout(parts.scheme, parts.netloc)
+        try:
+            conn.request("GET", target, headers=self.__headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+        # the server dropped an idle keep-alive connection, retry once on a fresh one
+        conn = self.__connect(parts.scheme, parts.netloc)
+        conn.request("GET", target, headers=self.__headers)
+        return conn, conn.getresponse()
+
+    @contextmanager
+    def __response(self, url: str):
+        for _ in range(self.MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            conn, ret = self.__open(parts)
+            try:
+                if ret.status in (301, 302, 303, 307, 308) and ret.getheader("Location"):
+                    ret.read()
+                    url = urljoin(url, ret.getheader("Location"))
+                    continue
+                if ret.status >= 400:
+                    ret.read()
+                    raise HTTPError(url, ret.status, ret.reason, ret.headers, None)
+                yield ret
+                return
+            finally:
+                self.__release(parts, conn, ret)
+        raise HTTPError(url, ret.status, "too many redirects", ret.headers, None)
+
+    def get(self, url: str) -> bytes:
+        with self.__response(url) as ret:
+            body = ret.read()
+            self.__local.received = len(body)
+            return decode_content(body, ret.getheader("Content-Encoding"))
+
+    def received(self, data: bytes) -> int:
+        return getattr(self.__local, "received", len(data))
+
+    @contextmanager
+    def stream(self, url: str):
+        with self.__response(url) as ret:
+            encoding = ret.getheader("Content-Encoding")
+            yield ret if encoding is None else io.BufferedReader(ContentDecoder(ret, encoding), CHUNK_SIZE)
+
+    def close(self) -> None:
+        for pool in list(self.__pools.values()):
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import os
+import queue
+import threading
+import pandas as pd
+from logging import getLogger
+from .metrics import Metrics
+from .profiles import StorageProfile, apply_profile, parquet_options
+
+logger = getLogger(__name__)
+
+
+class BatchWriter:
+    # buffers the tables of many symbols and writes every data set with one storage.write_many call.
+    # With background=True the writes run on a writer thread, so that parsing and disk I/O overlap;
+    # max_pending bounds the number of batches waiting to be written.
+    def __init__(self, storage, batch_size: int = 64, background: bool = False, max_pending: int = 4, catalog=None,
+                 metrics: Metrics = None, profile: StorageProfile = None):
+        self.storage = storage
+        self.profile = profile
+        self.catalog = catalog
+        self.metrics = metrics
+        self.batch_size = max(int(batch_size), 1)
+        self.background = background
+        self.__lock = threading.Lock()
+        self.__buffer = {}
+        self.__error = None
+        self.__queue = queue.Queue(max_pending) if background else None
+        self.__thread = None
+        if background:
+            self.__thread = threading.Thread(target=self.__run, name="coco-quant-writer", daemon=True)
+            self.__thread.start()
+
+    def __write(self, dataset_dir: str, frames: dict) -> None:
+        if self.profile is not None:
+            frames = {symbol: apply_profile(self.profile, dataset_dir, data) for symbol, data in frames.items()}
+        if self.metrics is not None:
+            with self.metrics.timed(os.path.basename(os.path.normpath(dataset_dir)), "write") as timing:
+                self.storage.write_many(dataset_dir, frames, parquet_options(self.profile))
+                timing.rows = sum(len(data) for data in frames.values())
+        else:
+            self.storage.write_many(dataset_dir, frames, parquet_options(self.profile))
+        if self.catalog is not None:
+            for symbol, data in frames.items():
+                self.catalog.record_frame(dataset_dir, symbol, data)
+        logger.debug(f"wrote {len(frames)} symbols to {dataset_dir}")
+
+    def __run(self) -> None:
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            try:
+                self.__write(*item)
+            except BaseException as ex:
+                logger.error(f"writer failed: {item[0]}, error={ex}")
+                self.__error = self.__error or ex
+
+    def __submit(self, dataset_dir: str, frames: dict) -> None:
+        if self.__error is not None:
+            raise self.__error
+        if self.__queue is not None:
+            self.__queue.put((dataset_dir, frames))
+        else:
+            self.__write(dataset_dir, frames)
+
+    def add(self, dataset_dir: str, symbol: str, data: pd.DataFrame) -> None:
+        with self.__lock:
+            frames = self.__buffer.setdefault(dataset_dir, {})
+            frames[symbol] = data
+            if len(frames) < self.batch_size:
+                return
+            del self.__buffer[dataset_dir]
+        self.__submit(dataset_dir, frames)
+
+    def flush(self) -> None:
+        with self.__lock:
+            buffer, self.__buffer = self.__buffer, {}
+        for dataset_dir, frames in buffer.items():
+            self.__submit(dataset_dir, frames)
+
+    def close(self) -> None:
+        # writes what is left and waits for the writer thread, an error of the thread is raised here
+        try:
+            self.flush()
+        finally:
+            if self.__thread is not None:
+                self.__queue.put(None)
+                self.__thread.join()
+                self.__thread = None
+        if self.__error is not None:
+            raise self.__error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -6,5 +6,6 @@ setup(
     description='Coco Trader SDK',
     url='https://github.com/minisoba/coco-quant-sdk',
     packages=find_packages(),
-    install_requires=['pandas']
+    install_requires=['pandas'],
+    extras_require={'arrow': ['pyarrow']}
 )